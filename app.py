@@ -1,22 +1,34 @@
 import streamlit as st
-from database.mongodb import MongoDB
-from services.chat_service import ChatService
-from services.persona_service import PersonaService
-from utils.helpers import get_session_id, initialize_chat_history, add_message_to_history
+from utils.helpers import (
+    get_session_id, initialize_chat_history, add_message_to_history,
+    get_db, get_chat_service, get_persona_service, get_analysis_queue, start_metrics_export
+)
+from services.analysis_queue import ACTIVE, DONE
+from utils.config import config
+from utils.metrics import metrics, profiler
 import pandas as pd
 
 # Page configuration
 st.set_page_config(page_title="AI Chatbot with Persona Analysis", layout="wide")
 
 # Initialize services
-db = MongoDB()
-chat_service = ChatService()
-persona_service = PersonaService()
+db = get_db()
+chat_service = get_chat_service()
+persona_service = get_persona_service(db)
+analysis_queue = get_analysis_queue(persona_service, db)
+start_metrics_export()
 
 # Initialize session state
 initialize_chat_history()
 session_id = get_session_id()
 
+# Profile this request with cProfile when an administrator turned it on.
+# ?profile=1 is only honoured when allow_profile_query is set, since any
+# visitor could add it.
+profile_request = st.session_state.get("profile_requests", False) or (
+    config.flag("allow_profile_query") and st.query_params.get("profile") == "1"
+)
+
 # App title
 st.title("AI Chatbot with Persona Analysis")
 
@@ -24,11 +36,18 @@ st.title("AI Chatbot with Persona Analysis")
 with st.sidebar:
     st.header("Chat History")
     
-    # Get user's chat history from MongoDB
-    mongo_chat_history = db.get_user_chat_history(session_id)
+    # Get only the most recent exchanges from MongoDB; older ones load on demand
+    if "history_limit" not in st.session_state:
+        st.session_state.history_limit = int(config.get("sidebar_history_limit", 20))
+    mongo_chat_history = db.get_recent_chat_history(session_id, limit=st.session_state.history_limit)
     
     # Display chat history in sidebar
     if mongo_chat_history:
+        if len(mongo_chat_history) == st.session_state.history_limit:
+            if st.button("Load older messages"):
+                st.session_state.history_limit += int(config.get("sidebar_history_limit", 20))
+                st.rerun()
+        
         for chat in mongo_chat_history:
             st.text_area(
                 "You:", 
@@ -51,15 +70,32 @@ with st.sidebar:
     # Persona analysis section
     st.header("Persona Analysis")
     
-    # Analyze button
+    # Analyze button; the analysis runs on the background queue so this
+    # script (and everyone else served by the process) is not held up
     if st.button("Analyze My Persona"):
-        user_messages = db.get_all_user_messages(session_id)
-        if user_messages:
-            with st.spinner("Analyzing your communication style..."):
-                persona = persona_service.analyze_user_persona(user_messages)
-                st.session_state.persona = persona
-        else:
-            st.session_state.persona = "Please chat with the bot first so we can analyze your persona."
+        analysis_queue.submit(session_id)
+        st.session_state.analysis_requested = True
+    
+    # Only this fragment reruns while the job is queued or running; once it
+    # finishes, the whole page reruns to show the result
+    @st.fragment(run_every=float(config.get("analysis_poll_interval", 1.0)))
+    def analysis_status():
+        job = analysis_queue.latest(session_id)
+        if job is not None and job["status"] in ACTIVE:
+            st.info("Analyzing your communication style...")
+            return
+        st.session_state.analysis_requested = False
+        if job is not None and job["status"] == DONE:
+            st.session_state.persona = job["result"]
+        elif job is not None:
+            st.session_state.analysis_error = job.get("error", "unknown error")
+        st.rerun()
+    
+    if st.session_state.get("analysis_requested"):
+        st.session_state.pop("analysis_error", None)
+        analysis_status()
+    if "analysis_error" in st.session_state:
+        st.error(f"Persona analysis failed: {st.session_state.analysis_error}")
     
     # Display persona if available
     if "persona" in st.session_state:
@@ -87,6 +123,27 @@ with st.sidebar:
                 st.success(f"Conversation saved as example of '{selected_persona}' persona")
             else:
                 st.error("Not enough messages to use as training data")
+    
+    with st.expander("Admin: Database Connections"):
+        st.json(db.pool_stats())
+    
+    with st.expander("Admin: Chat Latency"):
+        st.json(chat_service.stream_stats())
+    
+    with st.expander("Admin: OpenAI Requests"):
+        st.json(chat_service.llm.stats())
+    
+    with st.expander("Admin: Latency Breakdown"):
+        breakdown = pd.DataFrame.from_dict(metrics.snapshot(), orient="index")
+        if breakdown.empty:
+            st.write("No timed operations yet.")
+        else:
+            breakdown["share"] = (breakdown["total_s"] / breakdown["total_s"].sum()).map("{:.1%}".format)
+            st.dataframe(breakdown.sort_values("total_s", ascending=False))
+        st.toggle("Profile my requests", key="profile_requests")
+        if profiler.last_summary:
+            st.caption(f"Latest profile: {profiler.last_path}")
+            st.code(profiler.last_summary)
 
 # Display chat history in main area
 for message in st.session_state.messages:
@@ -97,25 +154,41 @@ for message in st.session_state.messages:
 user_message = st.chat_input("Type your message here...")
 
 if user_message:
-    # Add user message to chat
-    add_message_to_history("user", user_message)
-    with st.chat_message("user"):
-        st.markdown(user_message)
-    
-    # Get chat history for context
-    mongo_chat_history = db.get_user_chat_history(session_id)
-    
-    # Get bot response
-    with st.spinner("Thinking..."):
-        bot_response = chat_service.get_bot_response(user_message, mongo_chat_history)
-    
-    # Add bot response to chat
-    add_message_to_history("assistant", bot_response)
-    with st.chat_message("assistant"):
-        st.markdown(bot_response)
-    
-    # Save the exchange to MongoDB
-    db.save_message(session_id, user_message, bot_response)
+    with profiler.profile("chat_turn", profile_request):
+        # Add user message to chat
+        add_message_to_history("user", user_message)
+        with st.chat_message("user"):
+            st.markdown(user_message)
+        
+        # The context is the latest chat_context_turns exchanges, independent of
+        # how far back the sidebar has been paged; the sidebar already loaded
+        # them (including writes still buffered for this session) unless the
+        # context is longer than its page. Anything earlier reaches the prompt
+        # through the rolling summary.
+        context_turns = int(config.get("chat_context_turns", 20))
+        if st.session_state.history_limit >= context_turns:
+            context_history = mongo_chat_history[-context_turns:]
+        else:
+            context_history = db.get_recent_chat_history(session_id, limit=context_turns)
+        load_earlier = None
+        if len(context_history) == context_turns:
+            def load_earlier(first_turn, limit):
+                return db.get_recent_chat_history(session_id, limit=limit, before=first_turn["timestamp"])
+        
+        # Stream the bot response as it is generated
+        with st.chat_message("assistant"):
+            bot_response = st.write_stream(
+                chat_service.stream_bot_response(user_message, context_history, session_id, load_earlier)
+            )
+        
+        # Add bot response to chat
+        add_message_to_history("assistant", bot_response)
+        
+        # Save the exchange to MongoDB once the full response has arrived
+        db.save_message(
+            session_id, user_message, bot_response,
+            profile_update=persona_service.profile_update(user_message)
+        )
 
 # Add information about the persona model
 st.markdown("---")
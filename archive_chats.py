@@ -0,0 +1,36 @@
+import argparse
+from database.mongodb import MongoDB
+from utils.config import config, load_env_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Move idle chat sessions from the hot collection to the archive")
+    parser.add_argument("--idle-days", type=float, help="Archive sessions with no exchange for this many days "
+                                                      "(default: the chat_archive_after_days setting or 30)")
+    parser.add_argument("--grace-hours", type=float, default=1.0,
+                        help="Hours archived exchanges stay in the hot collection before the TTL removes them")
+    parser.add_argument("--no-compress", action="store_true", help="Store archived exchanges as plain arrays")
+    parser.add_argument("--shard", action="store_true",
+                        help="Shard the chat collections on a hashed session_id first (needs a mongos)")
+    
+    args = parser.parse_args()
+    
+    # Load configuration and connect to MongoDB
+    load_env_file()
+    db = MongoDB()
+    
+    if args.shard:
+        try:
+            db.shard_chat_collections()
+            print("Chat collections sharded on hashed session_id")
+        except Exception as e:
+            print(f"Error sharding chat collections: {e}")
+            return
+    
+    idle_days = args.idle_days if args.idle_days is not None else float(config.get("chat_archive_after_days", 30))
+    sessions, exchanges = db.archive_sessions(
+        idle_seconds=idle_days * 86400, grace_seconds=args.grace_hours * 3600, compress=not args.no_compress
+    )
+    print(f"Archived {exchanges} exchanges from {sessions} sessions idle for {idle_days:g} days")
+
+if __name__ == "__main__":
+    main()
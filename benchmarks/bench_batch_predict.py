@@ -0,0 +1,62 @@
+"""Measure per-row prediction latency across batch sizes
+
+Trains a pipeline variant on a synthetic corpus and scores preprocessed
+session texts through PersonaModel.predict_batch at batch sizes from 1 to
+10,000, reporting the median per-row latency and rows per second. The
+largest batch is also scored in chunks to show the cost of bounding memory.
+No prediction cache is used. Run from the repository root:
+    
+    python -m benchmarks.bench_batch_predict --classifier forest
+"""
+import argparse
+import statistics
+import time
+from ml.model import PersonaModel, VECTORIZERS, CLASSIFIERS
+from ml.preprocess import FastTextPreprocessor
+from benchmarks.synthetic import generate_labeled_sessions
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+def measure(model, texts, repeat, chunk_size=None):
+    """Median seconds per predict_batch call over repeat calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict_batch(texts, chunk_size=chunk_size)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def report(label, rows, seconds):
+    print(f"{label:<18}{rows:>8}{seconds / rows * 1e6:>14.1f}{rows / seconds:>14.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched persona prediction")
+    parser.add_argument("--vectorizer", choices=VECTORIZERS, default="tfidf")
+    parser.add_argument("--classifier", choices=CLASSIFIERS, default="forest")
+    parser.add_argument("--train-sessions", type=int, default=3000, help="Synthetic sessions to train on")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Chunk size for the chunked run")
+    parser.add_argument("--repeat", type=int, default=3, help="Calls per batch size")
+    args = parser.parse_args()
+    
+    preprocessor = FastTextPreprocessor()
+    texts, labels = generate_labeled_sessions(args.train_sessions, seed=1)
+    model = PersonaModel()
+    model.create_pipeline(vectorizer=args.vectorizer, classifier=args.classifier)
+    model.pipeline.fit(preprocessor.preprocess_many(texts), labels)
+    model._local["categories"] = model.pipeline.classes_.tolist()
+    
+    scoring_texts, _ = generate_labeled_sessions(max(BATCH_SIZES), seed=2)
+    scoring_texts = preprocessor.preprocess_many(scoring_texts)
+    
+    print(f"{args.vectorizer}+{args.classifier}")
+    print(f"{'mode':<18}{'batch':>8}{'us per row':>14}{'rows per s':>14}")
+    for size in BATCH_SIZES:
+        # Small batches are cheap; repeat them enough for a stable median
+        repeat = max(args.repeat, 100 // size)
+        report("batch", size, measure(model, scoring_texts[:size], repeat))
+    
+    size = max(BATCH_SIZES)
+    report(f"chunks of {args.chunk_size}", size, measure(model, scoring_texts[:size], args.repeat, args.chunk_size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure cold import time of the app's modules against a startup budget
+
+Each module is imported in a fresh interpreter, several times, and the
+median wall time is compared with its budget. The heavy libraries a module
+pulls in are listed too; importing one that the module must load lazily
+fails the check as well. Exits non-zero if any module is over budget. Run
+from the repository root:
+    
+    python -m benchmarks.bench_import
+    python -X importtime -c "import services.persona_service" 2> importtime.log  # to dig in
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["streamlit", "openai", "sklearn", "scipy", "pandas", "nltk", "textblob", "tiktoken"]
+
+# Budget in seconds, and heavy modules that must not be loaded by the import
+BUDGETS = {
+    "utils.config": (0.05, HEAVY_MODULES),
+    "ml.preprocess": (0.25, HEAVY_MODULES),
+    "ml.features": (0.4, HEAVY_MODULES),
+    "ml.model": (0.5, HEAVY_MODULES),
+    "database.mongodb": (0.5, HEAVY_MODULES),
+    "services.chat_service": (0.4, HEAVY_MODULES),
+    "services.persona_service": (0.6, HEAVY_MODULES),
+    "score_personas": (0.8, HEAVY_MODULES),
+    # Training needs scikit-learn (which imports pandas itself) but nothing else heavy
+    "train_persona_model": (3.0, ["streamlit", "openai", "nltk", "textblob", "tiktoken"]),
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, repeat):
+    """Median import time of module in fresh interpreters, and the heavy modules it loaded"""
+    timings, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded = result["loaded"]
+    return statistics.median(timings), loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import times")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    args = parser.parse_args()
+    
+    failures = []
+    print(f"{'module':<28}{'seconds':>9}{'budget':>9}  status  heavy modules loaded")
+    for module, (budget, forbidden) in BUDGETS.items():
+        seconds, loaded = measure(module, args.repeat)
+        unexpected = [name for name in loaded if name in forbidden]
+        ok = seconds <= budget and not unexpected
+        if not ok:
+            failures.append(module)
+        print(f"{module:<28}{seconds:>9.3f}{budget:>9.2f}  {'ok' if ok else 'FAIL':<6}  {', '.join(loaded) or '-'}")
+    
+    if failures:
+        print(f"Over the cold-start budget: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
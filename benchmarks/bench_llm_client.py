@@ -0,0 +1,94 @@
+"""Measure LLMClient throughput against the local fake OpenAI server
+
+Sends the same number of chat completions through the shared client from a
+thread pool and from asyncio, against a FakeLLMServer with a fixed latency
+and, optionally, a server-side rate limit that answers 429. Reports
+requests per second, retries and time spent throttled for each, then fires
+identical persona-analysis prompts at once to show them coalesced into one
+request. Needs the OpenAI SDK but no network or API key. Run from the
+repository root:
+    
+    python -m benchmarks.bench_llm_client --requests 500 --concurrency 32
+    python -m benchmarks.bench_llm_client --server-rate-limit 100 --client-rate 90
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.fake_llm import FakeLLMServer
+from services.llm import LLMClient
+
+MODEL = "gpt-3.5-turbo"
+
+def prompt(i):
+    return [{"role": "user", "content": f"Message number {i}"}]
+
+def make_client(server, args):
+    return LLMClient(
+        api_key="offline", base_url=server.base_url, timeout=10,
+        max_concurrency=args.concurrency, requests_per_second=args.client_rate, backoff=0.1
+    )
+
+def report(label, server, client, seconds, n):
+    stats = client.stats()
+    print(
+        f"{label:<10}{n / seconds:>10.1f} req/s  {seconds:>7.2f} s  "
+        f"sent {stats['requests']:>5}  retries {stats['retries']:>4}  "
+        f"429/500 {server.rejected:>4}  throttled {stats['throttled_seconds']:.2f} s"
+    )
+
+def run_threads(server, args):
+    client = make_client(server, args)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: client.complete(MODEL, prompt(i), max_tokens=50), range(args.requests)))
+    return client, time.perf_counter() - started
+
+def run_async(server, args):
+    client = make_client(server, args)
+    
+    async def run():
+        await asyncio.gather(*(client.acomplete(MODEL, prompt(i), max_tokens=50) for i in range(args.requests)))
+    
+    started = time.perf_counter()
+    asyncio.run(run())
+    return client, time.perf_counter() - started
+
+def run_coalesced(server, args):
+    client = make_client(server, args)
+    messages = [{"role": "user", "content": "Analyze these messages: the same session"}]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        replies = list(pool.map(lambda _: client.complete("gpt-4", messages, coalesce=True), range(args.concurrency)))
+    return client, len(set(replies))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared LLM client offline")
+    parser.add_argument("--requests", type=int, default=500, help="Completions per run")
+    parser.add_argument("--concurrency", type=int, default=32, help="Threads, and the client's concurrency limit")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake server latency per request")
+    parser.add_argument("--server-rate-limit", type=int, default=0, help="Requests per second the server accepts")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests the server fails with a 500")
+    parser.add_argument("--client-rate", type=float, default=0, help="Client-side requests per second (0: unlimited)")
+    args = parser.parse_args()
+    
+    for label, run in [("threads", run_threads), ("asyncio", run_async)]:
+        server = FakeLLMServer(latency=args.latency, rate_limit=args.server_rate_limit,
+                               failure_rate=args.failure_rate).start()
+        try:
+            client, seconds = run(server, args)
+            report(label, server, client, seconds, args.requests)
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    server = FakeLLMServer(latency=max(args.latency, 0.2)).start()
+    try:
+        client, distinct = run_coalesced(server, args)
+        print(f"coalesced {args.concurrency} identical prompts into {server.requests} request(s), "
+              f"{distinct} distinct reply")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
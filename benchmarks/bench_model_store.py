@@ -0,0 +1,71 @@
+"""Compare model artifact layouts by size and load time
+
+Trains the default TF-IDF + RandomForest pipeline on a synthetic corpus and
+saves it the way PersonaModel used to (a plain joblib dump) and through
+ModelStore with different compression levels. For each layout it reports
+the file size, the time to load it with and without memory-mapping, and
+the time to verify its checksum. Run from the repository root:
+    
+    python -m benchmarks.bench_model_store --sessions 5000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import joblib
+from ml.model import PersonaModel
+from ml.preprocess import FastTextPreprocessor
+from ml.store import ModelStore, file_checksum
+from benchmarks.synthetic import generate_labeled_sessions
+
+LAYOUTS = [
+    ("joblib (previous)", None),
+    ("store, uncompressed", 0),
+    ("store, zlib 1", 1),
+    ("store, zlib 3", 3),
+]
+
+def time_call(function, repeat):
+    """Median wall time of repeated calls, in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model artifact layouts")
+    parser.add_argument("--sessions", type=int, default=5000, help="Synthetic labeled sessions to train on")
+    parser.add_argument("--repeat", type=int, default=5, help="Loads per measurement")
+    args = parser.parse_args()
+    
+    texts, labels = generate_labeled_sessions(args.sessions)
+    processed = FastTextPreprocessor().preprocess_many(texts)
+    model = PersonaModel()
+    model.create_pipeline()
+    model.pipeline.fit(processed, labels)
+    model._local["categories"] = model.pipeline.classes_.tolist()
+    model._local["version"] = "bench"
+    
+    print(f"{'layout':<22}{'size MB':>10}{'load ms':>10}{'mmap ms':>10}{'verify ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, compress in LAYOUTS:
+            if compress is None:
+                path = os.path.join(tmp, "persona_model.joblib")
+                joblib.dump(model._local, path)
+            else:
+                store = ModelStore(os.path.join(tmp, f"store-{compress}"), compress=compress)
+                store.save(model._local)
+                path = store.artifact_path("bench")
+            
+            load_ms = time_call(lambda: joblib.load(path), args.repeat)
+            # joblib cannot memory-map compressed files and falls back to a full load
+            mmap_ms = time_call(lambda: joblib.load(path, mmap_mode="r"), args.repeat) if not compress else float("nan")
+            verify_ms = time_call(lambda: file_checksum(path), args.repeat)
+            size = os.path.getsize(path) / 1e6
+            print(f"{name:<22}{size:>10.2f}{load_ms:>10.1f}{mmap_ms:>10.1f}{verify_ms:>11.1f}")
+
+if __name__ == "__main__":
+    main()
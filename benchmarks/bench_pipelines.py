@@ -0,0 +1,90 @@
+"""Compare PersonaModel pipeline variants on a synthetic labeled corpus
+
+Reports training time, peak traced memory during training, artifact size,
+single-text and batch predict latency, and held-out accuracy. Run from the
+repository root:
+
+    python -m benchmarks.bench_pipelines --sessions 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import joblib
+from sklearn.model_selection import train_test_split
+from ml.model import PersonaModel
+from ml.preprocess import FastTextPreprocessor
+from benchmarks.synthetic import generate_labeled_sessions
+
+VARIANTS = [
+    {"vectorizer": "tfidf", "classifier": "forest", "stylometric": False},
+    {"vectorizer": "tfidf", "classifier": "linear", "stylometric": False},
+    {"vectorizer": "hashing", "classifier": "linear", "stylometric": False},
+    {"vectorizer": "tfidf", "classifier": "forest", "stylometric": True},
+    {"vectorizer": "tfidf", "classifier": "linear", "stylometric": True},
+]
+
+def variant_name(options):
+    name = f"{options['vectorizer']}+{options['classifier']}"
+    return name + "+style" if options["stylometric"] else name
+
+def benchmark_variant(options, texts, processed, labels):
+    """Train and measure one pipeline variant"""
+    model = PersonaModel()
+    model.create_pipeline(**options)
+    inputs = texts if model.expects_raw_text else processed
+    X_train, X_test, y_train, y_test = train_test_split(inputs, labels, test_size=0.2, random_state=42)
+    pipeline = model.pipeline
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    train_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.joblib")
+        joblib.dump({"pipeline": pipeline}, path)
+        size = os.path.getsize(path)
+    
+    start = time.perf_counter()
+    for text in X_test[:100]:
+        pipeline.predict_proba([text])
+    single_ms = (time.perf_counter() - start) / min(len(X_test), 100) * 1000
+    
+    start = time.perf_counter()
+    predictions = pipeline.predict(X_test)
+    batch_ms = (time.perf_counter() - start) / len(X_test) * 1000
+    
+    accuracy = sum(p == y for p, y in zip(predictions, y_test)) / len(y_test)
+    return {
+        "variant": variant_name(options),
+        "train_s": train_seconds,
+        "peak_mb": peak / 2 ** 20,
+        "size_mb": size / 2 ** 20,
+        "single_ms": single_ms,
+        "batch_ms_per_row": batch_ms,
+        "accuracy": accuracy,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark persona pipeline variants")
+    parser.add_argument("--sessions", type=int, default=5000, help="Number of synthetic labeled sessions")
+    args = parser.parse_args()
+    
+    texts, labels = generate_labeled_sessions(args.sessions)
+    processed = FastTextPreprocessor().preprocess_many(texts)
+    
+    columns = ["variant", "train_s", "peak_mb", "size_mb", "single_ms", "batch_ms_per_row", "accuracy"]
+    print("".join(f"{column:>18}" for column in columns))
+    for options in VARIANTS:
+        result = benchmark_variant(options, texts, processed, labels)
+        print("".join(
+            f"{result[column]:>18.3f}" if isinstance(result[column], float) else f"{result[column]:>18}"
+            for column in columns
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Compare TextPreprocessor against FastTextPreprocessor
+
+Run from the repository root:
+
+    python -m benchmarks.bench_preprocess --texts 20000
+"""
+import argparse
+import time
+from ml.preprocess import TextPreprocessor, FastTextPreprocessor
+from benchmarks.synthetic import generate_messages
+
+def time_call(fn, *args, **kwargs):
+    """Run fn once and return its result and elapsed seconds"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text preprocessing")
+    parser.add_argument("--texts", type=int, default=20000, help="Number of synthetic messages")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Workers for the process pool run")
+    args = parser.parse_args()
+    
+    texts = generate_messages(args.texts)
+    reference = TextPreprocessor()
+    fast = FastTextPreprocessor()
+    
+    expected, baseline = time_call(lambda: [reference.preprocess(text) for text in texts])
+    serial, serial_time = time_call(fast.preprocess_many, texts)
+    pooled, pooled_time = time_call(fast.preprocess_many, texts, n_jobs=args.n_jobs)
+    
+    if serial != expected or pooled != expected:
+        raise SystemExit("FastTextPreprocessor output differs from TextPreprocessor")
+    
+    print(f"{len(texts)} texts, outputs identical")
+    print(f"{'mode':<28}{'seconds':>10}{'texts/s':>12}{'speedup':>10}")
+    for name, elapsed in [
+        ("TextPreprocessor", baseline),
+        ("FastTextPreprocessor", serial_time),
+        (f"Fast + pool (n_jobs={args.n_jobs})", pooled_time),
+    ]:
+        print(f"{name:<28}{elapsed:>10.3f}{len(texts) / elapsed:>12.0f}{baseline / elapsed:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
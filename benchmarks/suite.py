@@ -0,0 +1,265 @@
+"""Offline benchmark suite for the whole persona stack
+
+Runs every stage against synthetic conversations, with mongomock standing in
+for MongoDB and FakeOpenAIClient for the OpenAI API, so results depend only
+on this code and the machine. Each scenario reports throughput, p50/p99
+latency per operation and peak traced memory. Results are written to
+benchmarks/results/ as JSON, and a previous result file can be given as a
+baseline to flag regressions. Run from the repository root after
+`pip install -r requirements-dev.txt`, which adds mongomock:
+    
+    python -m benchmarks.suite --sessions 2000
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json
+
+Latency and memory are measured in separate passes because tracemalloc
+slows down the code it traces; the memory pass of per-operation scenarios
+covers at most --memory-ops operations.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from utils.config import configure
+from benchmarks.synthetic import generate_conversations
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Configuration normally read from .streamlit/secrets.toml or the environment
+OFFLINE_SECRETS = {
+    "openai_api_key": "offline",
+    "mongo_uri": "mongodb://localhost",
+    "mongo_db_name": "persona_bench",
+    "mongo_collection": "chat_history",
+    "persona_collection": "persona_labels",
+}
+
+class Scenario:
+    """Timing and memory measurements of one benchmarked stage"""
+    
+    def __init__(self, name, rows_per_op=1):
+        self.name = name
+        self.rows_per_op = rows_per_op
+        self.latencies = []
+        self.peak_bytes = 0
+    
+    def time_ops(self, operation, items):
+        """Call operation once per item, recording the latency of each call"""
+        for item in items:
+            start = time.perf_counter()
+            operation(item)
+            self.latencies.append(time.perf_counter() - start)
+    
+    def trace_memory(self, operation, items):
+        """Call operation once per item under tracemalloc, recording the peak"""
+        tracemalloc.start()
+        try:
+            for item in items:
+                operation(item)
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    
+    def result(self):
+        latencies = np.asarray(self.latencies)
+        total = latencies.sum()
+        return {
+            "ops": len(latencies),
+            "rows": len(latencies) * self.rows_per_op,
+            "seconds": round(float(total), 4),
+            "rows_per_second": round(len(latencies) * self.rows_per_op / total, 2) if total else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+            "peak_mb": round(self.peak_bytes / 1e6, 2),
+        }
+
+def run_scenario(name, operation, items, memory_items, rows_per_op=1, warmup=True):
+    """Measure a scenario and print its result
+    
+    With warmup, one untimed call first loads lazily initialized state
+    (NLTK corpora, caches) so it is not counted as the latency of the first
+    operation.
+    """
+    scenario = Scenario(name, rows_per_op)
+    if warmup:
+        operation(items[0])
+    scenario.time_ops(operation, items)
+    scenario.trace_memory(operation, memory_items)
+    result = scenario.result()
+    print(
+        f"{name:<18}{result['ops']:>7}{result['rows_per_second'] or 0:>14.1f}"
+        f"{result['p50_ms']:>11.3f}{result['p99_ms']:>11.3f}{result['peak_mb']:>10.2f}"
+    )
+    return result
+
+def run_suite(args):
+    """Run every scenario and return their results by name"""
+    import mongomock
+    from database.mongodb import MongoDB
+    from ml.features import FeatureExtractor
+    from ml.model import PersonaModel
+    from ml.preprocess import FastTextPreprocessor
+    from services.chat_service import ChatService
+    from services.fake_llm import FakeOpenAIClient
+    from services.persona_service import PersonaService
+    
+    conversations = generate_conversations(args.sessions, seed=args.seed)
+    messages = [message for _, conversation in conversations for message in conversation]
+    texts = ["\n".join(conversation) for _, conversation in conversations]
+    labels = [persona for persona, _ in conversations]
+    preprocessor = FastTextPreprocessor()
+    extractor = FeatureExtractor()
+    results = {}
+    
+    print(f"{'scenario':<18}{'ops':>7}{'rows/s':>14}{'p50 ms':>11}{'p99 ms':>11}{'peak MB':>10}")
+    memory_messages = messages[:args.memory_ops]
+    results["preprocess"] = run_scenario("preprocess", preprocessor.preprocess, messages, memory_messages)
+    results["features"] = run_scenario("features", extractor.extract_all_features, messages, memory_messages)
+    results["features_batch"] = run_scenario(
+        "features_batch", extractor.extract_features_batch, [messages], [messages],
+        rows_per_op=len(messages), warmup=False
+    )
+    
+    processed = preprocessor.preprocess_many(texts, n_jobs=1)
+    model = PersonaModel()
+    
+    def train(_):
+        model.create_pipeline()
+        model.pipeline.fit(processed, labels)
+    
+    results["train"] = run_scenario("train", train, [None], [None], rows_per_op=len(processed), warmup=False)
+    # Publish the model so PersonaService loads it the way the app does
+    model._local["categories"] = model.pipeline.classes_.tolist()
+    model.save()
+    
+    single_texts = processed[:args.single_ops]
+    results["predict_single"] = run_scenario(
+        "predict_single", lambda text: model.predict_batch([text]), single_texts, single_texts[:args.memory_ops]
+    )
+    batches = [
+        processed[i:i + args.batch_size] for i in range(0, len(processed) - args.batch_size + 1, args.batch_size)
+    ]
+    results["predict_batch"] = run_scenario(
+        "predict_batch", model.predict_batch, batches, batches[:1], rows_per_op=args.batch_size
+    )
+    
+    db = MongoDB(client=mongomock.MongoClient())
+    chat_service = ChatService(client=FakeOpenAIClient(latency=args.llm_latency, token_latency=args.token_latency))
+    persona_service = PersonaService(db)
+    turns = [
+        (f"session-{i}", message)
+        for i, (_, conversation) in enumerate(conversations[:args.chat_sessions])
+        for message in conversation
+    ]
+    
+    def chat_turn(turn):
+        session_id, user_message = turn
+        history = db.get_recent_chat_history(session_id)
+        reply = "".join(chat_service.stream_bot_response(user_message, history, session_id))
+        db.save_message(session_id, user_message, reply, profile_update=persona_service.profile_update(user_message))
+    
+    # Memory is traced replaying the first turns again as separate sessions
+    memory_turns = [(f"memory-{session_id}", message) for session_id, message in turns[:args.memory_ops]]
+    results["chat_turn"] = run_scenario("chat_turn", chat_turn, turns, memory_turns, warmup=False)
+    
+    session_ids = sorted({session_id for session_id, _ in turns})
+    results["analyze_profile"] = run_scenario(
+        "analyze_profile",
+        lambda session_id: persona_service.analyze_profile(db.get_persona_profile(session_id)),
+        session_ids, session_ids[:args.memory_ops]
+    )
+    return results
+
+def git_commit():
+    """Short hash of the checked out commit, if this is a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """Print changes against a baseline and return the scenarios that regressed
+    
+    A scenario regresses when its throughput drops, or its p99 latency or
+    peak memory grows, by more than threshold (a fraction).
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['created_at']} ({baseline.get('commit') or 'unknown commit'}):")
+    for name, result in results.items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        changes = []
+        for key, higher_is_better in (("rows_per_second", True), ("p99_ms", False), ("peak_mb", False)):
+            if not previous.get(key) or result.get(key) is None:
+                continue
+            change = result[key] / previous[key] - 1
+            regressed = -change > threshold if higher_is_better else change > threshold
+            changes.append(f"{key} {change:+.1%}{' REGRESSED' if regressed else ''}")
+            if regressed:
+                regressions.append(name)
+        print(f"  {name:<18}{', '.join(changes)}")
+    return sorted(set(regressions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--sessions", type=int, default=2000, help="Synthetic sessions to generate")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data")
+    parser.add_argument("--single-ops", type=int, default=500, help="Texts scored one at a time")
+    parser.add_argument("--batch-size", type=int, default=500, help="Texts per batch prediction")
+    parser.add_argument("--chat-sessions", type=int, default=100, help="Sessions replayed as chat turns")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake OpenAI wait before the first chunk")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake OpenAI wait between chunks")
+    parser.add_argument("--memory-ops", type=int, default=200, help="Operations per scenario traced for memory")
+    parser.add_argument("--output", type=str, help="Result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", type=str, metavar="BASELINE", help="Result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    
+    configure(OFFLINE_SECRETS)
+    commit = git_commit()
+    started = datetime.now()
+    # Models and caches are written relative to the working directory; keep
+    # them out of the checkout
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            scenarios = run_suite(args)
+        finally:
+            os.chdir(cwd)
+    
+    report = {
+        "created_at": started.isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{started.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("args") != report["args"]:
+            print("Warning: the baseline was run with different arguments")
+        regressions = compare(scenarios, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
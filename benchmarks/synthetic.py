@@ -0,0 +1,66 @@
+import random
+
+VOCABULARY = {
+    "Technical Professional": [
+        "deploy", "kubernetes", "cluster", "python", "latency", "database", "index",
+        "refactor", "pipeline", "container", "debugging", "servers", "API", "cache",
+    ],
+    "Student": [
+        "homework", "exam", "lecture", "professor", "essay", "deadline", "studying",
+        "classes", "grades", "semester", "assignment", "library", "notes", "quiz",
+    ],
+    "Business Executive": [
+        "revenue", "quarterly", "stakeholders", "strategy", "board", "growth", "margins",
+        "budget", "forecast", "hiring", "investors", "market", "roadmap", "KPIs",
+    ],
+    "Casual User": [
+        "movie", "weekend", "pizza", "friends", "music", "games", "vacation", "dogs",
+        "cooking", "funny", "weather", "shopping", "recipes", "sports",
+    ],
+}
+
+FILLER = [
+    "I", "think", "the", "my", "is", "was", "can", "you", "help", "with", "about",
+    "cannot", "gonna", "really", "please", "what", "how", "why", "and", "it's",
+]
+
+ENDINGS = [".", "?", "!", "...", ""]
+
+def generate_message(rng, persona):
+    """Generate one synthetic user message in the style of a persona"""
+    topic = VOCABULARY[persona]
+    words = [
+        rng.choice(topic) if rng.random() < 0.4 else rng.choice(FILLER)
+        for _ in range(rng.randint(4, 30))
+    ]
+    if rng.random() < 0.1:
+        words.insert(rng.randint(0, len(words)), f"https://example.com/{rng.randint(1, 999)}")
+    if rng.random() < 0.2:
+        words.insert(rng.randint(0, len(words)), str(rng.randint(1, 2024)))
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice(ENDINGS)
+
+def generate_messages(n, seed=42):
+    """Generate n synthetic user messages across all personas"""
+    rng = random.Random(seed)
+    personas = list(VOCABULARY)
+    return [generate_message(rng, rng.choice(personas)) for _ in range(n)]
+
+def generate_conversations(n, messages_per_session=(3, 12), seed=42):
+    """Generate n synthetic sessions as (persona label, list of user messages) pairs"""
+    rng = random.Random(seed)
+    personas = list(VOCABULARY)
+    conversations = []
+    for _ in range(n):
+        persona = rng.choice(personas)
+        messages = [generate_message(rng, persona) for _ in range(rng.randint(*messages_per_session))]
+        conversations.append((persona, messages))
+    return conversations
+
+def generate_labeled_sessions(n, messages_per_session=(3, 12), seed=42):
+    """Generate n labeled sessions as (combined text, persona label) lists"""
+    texts, labels = [], []
+    for persona, messages in generate_conversations(n, messages_per_session, seed):
+        texts.append("\n".join(messages))
+        labels.append(persona)
+    return texts, labels
@@ -0,0 +1,42 @@
+import zlib
+import bson
+
+# Exchanges per archive document; keeps every document far below MongoDB's 16 MB limit
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Fields of an exchange kept in the archive; session_id is stored once per document
+ARCHIVED_FIELDS = ("_id", "timestamp", "user_message", "bot_message")
+
+def archive_documents(session_id, exchanges, archived_at, compress=True, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Pack a session's exchanges, oldest first, into archive documents
+    
+    Each document holds up to chunk_size exchanges, either as a
+    zlib-compressed BSON blob or as a plain array, along with the time
+    range and count readers need to find and count them without decoding.
+    A document's _id is the _id of its first exchange, so archiving the
+    same exchanges again replaces rather than duplicates it.
+    """
+    documents = []
+    for start in range(0, len(exchanges), chunk_size):
+        chunk = [{field: exchange[field] for field in ARCHIVED_FIELDS if field in exchange}
+                 for exchange in exchanges[start:start + chunk_size]]
+        document = {
+            "_id": chunk[0]["_id"],
+            "session_id": session_id,
+            "start": chunk[0]["timestamp"],
+            "end": chunk[-1]["timestamp"],
+            "count": len(chunk),
+            "archived_at": archived_at,
+        }
+        if compress:
+            document["data"] = bson.Binary(zlib.compress(bson.encode({"exchanges": chunk})))
+        else:
+            document["exchanges"] = chunk
+        documents.append(document)
+    return documents
+
+def archived_exchanges(document):
+    """Get the exchanges stored in an archive document, oldest first"""
+    if "data" in document:
+        return bson.decode(zlib.decompress(document["data"]))["exchanges"]
+    return document["exchanges"]
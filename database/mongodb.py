@@ -1,46 +1,500 @@
+import threading
 import pymongo
-from datetime import datetime
-import streamlit as st
+from datetime import datetime, timedelta, timezone
+from utils.config import config
+from utils.metrics import instrument
+from .archive import archive_documents, archived_exchanges
+from .monitoring import PoolMonitor, CommandLatencyMonitor
+from .write_behind import WriteBehindWriter
 
+_clients = {}
+_clients_lock = threading.Lock()
+_indexed = set()
+
+# Fields the chat history readers need back from the server
+HISTORY_PROJECTION = {"user_message": 1, "bot_message": 1, "timestamp": 1}
+HISTORY_ORDER = [("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+# Labeled personas store only the message list; combined_text is kept on older documents
+LABEL_PROJECTION = {"session_id": 1, "messages": 1, "combined_text": 1, "persona_label": 1}
+
+def labeled_text(doc):
+    """Get the training text of a labeled persona document"""
+    if doc.get("combined_text") is not None:
+        return str(doc["combined_text"])
+    return "\n".join(str(message) for message in doc.get("messages") or [])
+
+def get_client(uri, **options):
+    """Get the process-wide pooled MongoClient for a URI and set of options
+    
+    MongoClient is thread-safe and owns a connection pool plus background
+    server monitoring, so it is created once per process and shared rather
+    than once per MongoDB instance. Returns the client and its monitors.
+    """
+    key = (uri, tuple(sorted(options.items())))
+    with _clients_lock:
+        if key not in _clients:
+            pool_monitor = PoolMonitor()
+            command_monitor = CommandLatencyMonitor()
+            client = pymongo.MongoClient(
+                uri, event_listeners=[pool_monitor, command_monitor], **options
+            )
+            _clients[key] = (client, pool_monitor, command_monitor)
+        return _clients[key]
+
+def client_options():
+    """Connection pool size and timeouts, overridable through configuration"""
+    return {
+        "maxPoolSize": int(config.get("mongo_max_pool_size", 50)),
+        "minPoolSize": int(config.get("mongo_min_pool_size", 0)),
+        "maxIdleTimeMS": int(config.get("mongo_max_idle_time_ms", 300000)),
+        "waitQueueTimeoutMS": int(config.get("mongo_wait_queue_timeout_ms", 5000)),
+        "serverSelectionTimeoutMS": int(config.get("mongo_server_selection_timeout_ms", 5000)),
+        "connectTimeoutMS": int(config.get("mongo_connect_timeout_ms", 5000)),
+        "socketTimeoutMS": int(config.get("mongo_socket_timeout_ms", 30000)),
+    }
+
+def _merge_tiers(archived, stored):
+    """Combine archived and hot exchanges in history order
+    
+    Archived exchanges stay in the hot collection until their TTL removes
+    them, so copies found in both are kept once.
+    """
+    if not archived:
+        return stored
+    archived_ids = {doc["_id"] for doc in archived}
+    merged = archived + [doc for doc in stored if doc["_id"] not in archived_ids]
+    merged.sort(key=lambda doc: (doc["timestamp"], doc["_id"]))
+    return merged
+
+def _apply_update(document, update):
+    """Apply the $inc/$set parts of an update document to a local copy"""
+    document = dict(document)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            *parents, leaf = path.split(".")
+            target = document
+            for key in parents:
+                target[key] = dict(target.get(key, {}))
+                target = target[key]
+            if operator == "$inc":
+                target[leaf] = target.get(leaf, 0) + value
+            elif operator == "$set":
+                target[leaf] = value
+    return document
+
+@instrument("mongodb")
 class MongoDB:
-    def __init__(self):
-        self.client = pymongo.MongoClient(st.secrets["mongo_uri"])
-        self.db = self.client[st.secrets["mongo_db_name"]]
-        self.chat_collection = self.db[st.secrets["mongo_collection"]]
-        self.persona_collection = self.db[st.secrets["persona_collection"]]
-    
-    def save_message(self, session_id, user_message, bot_message):
-        """Save a message exchange to MongoDB"""
+    def __init__(self, client=None):
+        if client is None:
+            client, self.pool_monitor, self.command_monitor = get_client(
+                config["mongo_uri"], **client_options()
+            )
+        else:
+            self.pool_monitor, self.command_monitor = None, None
+        self.client = client
+        self.db = self.client[config["mongo_db_name"]]
+        self.chat_collection = self.db[config["mongo_collection"]]
+        self.archive_collection = self.db[config.get("chat_archive_collection", "chat_archive")]
+        self.persona_collection = self.db[config["persona_collection"]]
+        self.profile_collection = self.db[config.get("profile_collection", "persona_profiles")]
+        self.prediction_cache_collection = self.db[config.get("prediction_cache_collection", "prediction_cache")]
+        self.results_collection = self.db[config.get("persona_results_collection", "persona_results")]
+        self.jobs_collection = self.db[config.get("analysis_jobs_collection", "analysis_jobs")]
+        self.writer = None
+        self.ensure_indexes()
+    
+    def enable_write_behind(self, flush_interval=0.5, max_batch=500):
+        """Make save_message return immediately and write exchanges in background batches"""
+        if self.writer is None:
+            self.writer = WriteBehindWriter(
+                self.chat_collection, self.profile_collection,
+                flush_interval=flush_interval, max_batch=max_batch
+            )
+    
+    def flush(self, timeout=None):
+        """Wait for buffered writes to reach MongoDB"""
+        return self.writer.flush(timeout) if self.writer else True
+    
+    def _pending_documents(self, session_id):
+        """Exchanges of a session that are buffered but not yet acknowledged"""
+        if self.writer is None:
+            return []
+        return [document for document, _ in self.writer.pending(session_id)]
+    
+    def _merge_pending(self, docs, pending):
+        """Append buffered exchanges that the query did not already return
+        
+        pending must be read before the query runs, so an exchange flushed in
+        between shows up in both and is dropped here rather than missed.
+        """
+        if not pending:
+            return docs
+        stored_ids = {doc["_id"] for doc in docs}
+        return docs + [doc for doc in pending if doc["_id"] not in stored_ids]
+    
+    def ensure_indexes(self):
+        """Create the indexes the query methods rely on, once per process
+        
+        create_index is a no-op when the index already exists, but it is
+        still a round trip, so each database is only checked once.
+        """
+        key = (id(self.client), self.db.name)
+        with _clients_lock:
+            if key in _indexed:
+                return
+            _indexed.add(key)
+        
+        # _id breaks ties between exchanges saved within the same millisecond
+        self.chat_collection.create_index([
+            ("session_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)
+        ])
+        # Archived exchanges are marked with expire_at and removed after a grace period
+        self.chat_collection.create_index("expire_at", expireAfterSeconds=0)
+        self.archive_collection.create_index([("session_id", pymongo.ASCENDING), ("start", pymongo.ASCENDING)])
+        self.persona_collection.create_index("session_id")
+        self.profile_collection.create_index("session_id", unique=True)
+        self.results_collection.create_index("session_id", unique=True)
+        self.jobs_collection.create_index([("session_id", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING)])
+        # At most one queued or running job per session, across replicas
+        self.jobs_collection.create_index(
+            "session_id", unique=True, partialFilterExpression={"active": True}, name="session_id_active"
+        )
+        # Finished analyses are only polled shortly after they were requested
+        self.jobs_collection.create_index(
+            "created_at", expireAfterSeconds=int(config.get("analysis_job_ttl", 7 * 24 * 3600))
+        )
+    
+    def save_message(self, session_id, user_message, bot_message, profile_update=None):
+        """Save a message exchange to MongoDB
+        
+        If a profile update (from ProfileBuilder.message_update) is given, it
+        is applied to the session's running persona profile.
+        """
         document = {
             "session_id": session_id,
             "timestamp": datetime.now(),
             "user_message": user_message,
             "bot_message": bot_message
         }
+        if self.writer:
+            self.writer.save(document, profile_update)
+            return
+        
         self.chat_collection.insert_one(document)
+        if profile_update:
+            self.profile_collection.update_one({"session_id": session_id}, profile_update, upsert=True)
+    
+    def get_persona_profile(self, session_id):
+        """Get the running persona profile for a session"""
+        before = self.writer.pending(session_id) if self.writer else []
+        profile = self.profile_collection.find_one(
+            {"session_id": session_id}, {"_id": 0, "applied_exchanges": 0}
+        )
+        if not before:
+            return profile
+        
+        # Fold in updates that were still unacknowledged after the read
+        still_pending = {id(update) for _, update in self.writer.pending(session_id)}
+        for _, update in before:
+            if update and id(update) in still_pending:
+                profile = _apply_update(profile or {"session_id": session_id}, update)
+        return profile
+    
+    def _archived(self, session_ids, before=None):
+        """Get the archived exchanges of sessions, oldest first, grouped by session"""
+        query = {"session_id": {"$in": list(session_ids)}}
+        if before is not None:
+            query["start"] = {"$lt": before}
+        exchanges = {}
+        cursor = self.archive_collection.find(query).sort([("session_id", pymongo.ASCENDING), ("start", pymongo.ASCENDING)])
+        for document in cursor:
+            exchanges.setdefault(document["session_id"], []).extend(
+                exchange for exchange in archived_exchanges(document)
+                if before is None or exchange["timestamp"] < before
+            )
+        return exchanges
+    
+    def _archived_recent(self, session_id, limit, before=None):
+        """Get at least the last `limit` archived exchanges of a session, decoding the newest documents only"""
+        query = {"session_id": session_id}
+        if before is not None:
+            query["start"] = {"$lt": before}
+        chunks, count = [], 0
+        for document in self.archive_collection.find(query).sort("start", pymongo.DESCENDING):
+            chunk = [exchange for exchange in archived_exchanges(document)
+                     if before is None or exchange["timestamp"] < before]
+            chunks.append(chunk)
+            count += len(chunk)
+            if count >= limit:
+                break
+        return [exchange for chunk in reversed(chunks) for exchange in chunk]
+    
+    def set_persona_profile(self, session_id, profile):
+        """Replace the running totals of a session's persona profile"""
+        self.profile_collection.update_one({"session_id": session_id}, {"$set": profile}, upsert=True)
     
     def get_user_chat_history(self, session_id):
-        """Get all chat history for a specific user session"""
-        cursor = self.chat_collection.find({"session_id": session_id}).sort("timestamp", 1)
-        return list(cursor)
+        """Get all chat history for a specific user session, from every tier"""
+        pending = self._pending_documents(session_id)
+        cursor = self.chat_collection.find({"session_id": session_id}, HISTORY_PROJECTION).sort(HISTORY_ORDER)
+        stored = list(cursor)
+        archived = self._archived([session_id]).get(session_id, [])
+        return self._merge_pending(_merge_tiers(archived, stored), pending)
+    
+    def get_recent_chat_history(self, session_id, limit=20, before=None):
+        """Get the most recent exchanges of a session in chronological order
+        
+        Pass the timestamp of the oldest exchange already shown as `before`
+        to page further back. The archive is only read once paging goes
+        past what the hot collection holds.
+        """
+        query = {"session_id": session_id}
+        pending = self._pending_documents(session_id)
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
+            pending = [doc for doc in pending if doc["timestamp"] < before]
+        cursor = self.chat_collection.find(query, HISTORY_PROJECTION).sort(
+            [(field, -direction) for field, direction in HISTORY_ORDER]
+        ).limit(limit)
+        stored = list(cursor)[::-1]
+        if len(stored) < limit:
+            stored = _merge_tiers(self._archived_recent(session_id, limit, before), stored)
+        return self._merge_pending(stored, pending)[-limit:]
+    
+    def iter_chat_history(self, session_id, batch_size=500):
+        """Stream a session's chat history without holding it all in memory
+        
+        Archive documents are decoded one at a time, before the hot
+        exchanges that follow them.
+        """
+        pending = self._pending_documents(session_id)
+        seen_ids = set()
+        archive_cursor = self.archive_collection.find({"session_id": session_id}).sort("start", pymongo.ASCENDING)
+        for document in archive_cursor:
+            for exchange in archived_exchanges(document):
+                seen_ids.add(exchange["_id"])
+                yield exchange
+        
+        cursor = self.chat_collection.find(
+            {"session_id": session_id}, HISTORY_PROJECTION, batch_size=batch_size
+        ).sort(HISTORY_ORDER)
+        for doc in cursor:
+            if doc["_id"] not in seen_ids:
+                seen_ids.add(doc["_id"])
+                yield doc
+        for doc in pending:
+            if doc["_id"] not in seen_ids:
+                yield doc
+    
+    def count_chat_history(self, session_id):
+        """Count the exchanges stored for a session, hot and archived"""
+        archived = list(self.archive_collection.find({"session_id": session_id}, {"count": 1, "end": 1}))
+        query = {"session_id": session_id, "expire_at": {"$exists": False}}
+        if archived:
+            # Unmarked hot exchanges up to the newest archived one were archived
+            # by a run that stopped before marking them
+            query["timestamp"] = {"$gt": max(document["end"] for document in archived)}
+        hot = self.chat_collection.count_documents(query)
+        return hot + sum(document["count"] for document in archived)
     
     def get_all_user_messages(self, session_id):
         """Get all user messages for persona analysis"""
-        cursor = self.chat_collection.find({"session_id": session_id})
-        return [doc["user_message"] for doc in cursor]
+        pending = self._pending_documents(session_id)
+        cursor = self.chat_collection.find(
+            {"session_id": session_id}, {"user_message": 1, "timestamp": 1}
+        ).sort(HISTORY_ORDER)
+        stored = list(cursor)
+        archived = self._archived([session_id]).get(session_id, [])
+        return [doc["user_message"] for doc in self._merge_pending(_merge_tiers(archived, stored), pending)]
+    
+    def get_all_session_ids(self):
+        """Get the ids of every session that has chat history"""
+        return list(set(self.chat_collection.distinct("session_id")) | set(self.archive_collection.distinct("session_id")))
+    
+    def get_user_messages_for_sessions(self, session_ids):
+        """Get user messages for many sessions with one query per tier"""
+        stored = {session_id: [] for session_id in session_ids}
+        cursor = self.chat_collection.find(
+            {"session_id": {"$in": list(stored)}},
+            {"session_id": 1, "user_message": 1, "timestamp": 1}
+        ).sort(HISTORY_ORDER)
+        for doc in cursor:
+            stored[doc["session_id"]].append(doc)
+        archived = self._archived(stored)
+        return {
+            session_id: [doc["user_message"] for doc in _merge_tiers(archived.get(session_id, []), docs)]
+            for session_id, docs in stored.items()
+        }
+    
+    def archive_sessions(self, idle_seconds, grace_seconds=3600, compress=True):
+        """Move the hot exchanges of sessions idle for idle_seconds into the archive
+        
+        Each session's exchanges are packed into archive documents (see
+        database.archive), then marked with an expire_at grace_seconds out
+        so the TTL index removes them from the hot collection once readers
+        that started before the move have finished. Rerunning after a crash
+        rewrites the same archive documents. Returns the number of sessions
+        and exchanges archived.
+        """
+        now = datetime.now()
+        # TTL indexes compare expire_at with the server's UTC clock
+        expire_at = datetime.now(timezone.utc) + timedelta(seconds=grace_seconds)
+        idle_sessions = self.chat_collection.aggregate([
+            {"$match": {"expire_at": {"$exists": False}}},
+            {"$group": {"_id": "$session_id", "last": {"$max": "$timestamp"}}},
+            {"$match": {"last": {"$lt": now - timedelta(seconds=idle_seconds)}}},
+        ], allowDiskUse=True)
+        
+        sessions = archived = 0
+        for session in idle_sessions:
+            session_id = session["_id"]
+            # Every filter carries session_id so writes route to one shard
+            exchanges = list(self.chat_collection.find(
+                {"session_id": session_id, "expire_at": {"$exists": False}}
+            ).sort(HISTORY_ORDER))
+            if not exchanges:
+                continue
+            for document in archive_documents(session_id, exchanges, now, compress=compress):
+                self.archive_collection.replace_one(
+                    {"session_id": session_id, "_id": document["_id"]}, document, upsert=True
+                )
+            self.chat_collection.update_many(
+                {"session_id": session_id, "_id": {"$in": [exchange["_id"] for exchange in exchanges]}},
+                {"$set": {"expire_at": expire_at}}
+            )
+            sessions += 1
+            archived += len(exchanges)
+        return sessions, archived
+    
+    def shard_chat_collections(self):
+        """Shard the hot and archive chat collections on a hashed session_id
+        
+        Every chat read and write filters on session_id, so each one is
+        routed to a single shard. Run once against a mongos router.
+        """
+        admin = self.client.admin
+        admin.command("enableSharding", self.db.name)
+        for collection in (self.chat_collection, self.archive_collection):
+            collection.create_index([("session_id", pymongo.HASHED)])
+            admin.command("shardCollection", collection.full_name, key={"session_id": "hashed"})
     
     def save_persona_label(self, session_id, messages, persona_label):
         """Save a labeled persona for training data"""
-        document = {
-            "session_id": session_id,
-            "timestamp": datetime.now(),
-            "messages": messages,
-            "combined_text": "\n".join(messages),
-            "persona_label": persona_label
-        }
-        self.persona_collection.insert_one(document)
+        self.save_persona_labels([
+            {"session_id": session_id, "messages": messages, "persona_label": persona_label}
+        ])
+    
+    def save_persona_labels(self, labels):
+        """Bulk upsert labeled personas, one document per session
+        
+        Labeling a session again replaces its messages and label. The
+        combined text is derived from the messages when read, so it is not
+        stored, and is removed from documents written before that changed.
+        """
+        now = datetime.now()
+        operations = [
+            pymongo.UpdateOne(
+                {"session_id": label["session_id"]},
+                {
+                    "$set": {"messages": label["messages"], "persona_label": label["persona_label"], "timestamp": now},
+                    "$unset": {"combined_text": ""},
+                },
+                upsert=True
+            )
+            for label in labels
+        ]
+        if operations:
+            self.persona_collection.bulk_write(operations, ordered=False)
+    
+    def get_persona_labels(self):
+        """Get the distinct persona labels in the training data, as strings like iter_labeled_records"""
+        return sorted({str(label) for label in self.persona_collection.distinct("persona_label")})
+    
+    def iter_labeled_records(self, batch_size=1000, skip=0):
+        """Stream labeled personas as lists of {id, session_id, text, persona_label}
+        
+        Documents come in _id order so that a resumed run can skip what it
+        has already seen.
+        """
+        cursor = self.persona_collection.find(
+            {}, LABEL_PROJECTION, batch_size=batch_size
+        ).sort("_id", pymongo.ASCENDING).skip(skip)
+        
+        batch = []
+        for doc in cursor:
+            # Labels written by hand or older code are not always strings
+            session_id = doc.get("session_id")
+            batch.append({
+                "id": str(doc["_id"]),
+                "session_id": str(session_id) if session_id is not None else None,
+                "text": labeled_text(doc),
+                "persona_label": str(doc["persona_label"]),
+            })
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def iter_labeled_personas(self, batch_size=1000, skip=0):
+        """Stream labeled personas as lists of (combined_text, persona_label)"""
+        for batch in self.iter_labeled_records(batch_size=batch_size, skip=skip):
+            yield [(record["text"], record["persona_label"]) for record in batch]
     
     def get_all_labeled_personas(self):
-        """Get all labeled personas for model training"""
-        cursor = self.persona_collection.find()
-        return list(cursor)
+        """Get all labeled personas for model training, with their combined_text"""
+        docs = list(self.persona_collection.find())
+        for doc in docs:
+            doc["combined_text"] = labeled_text(doc)
+            if doc.get("persona_label") is not None:
+                doc["persona_label"] = str(doc["persona_label"])
+        return docs
+    
+    def save_persona_results(self, results):
+        """Bulk upsert persona analysis results, one document per session"""
+        operations = [
+            pymongo.UpdateOne({"session_id": result["session_id"]}, {"$set": result}, upsert=True)
+            for result in results
+        ]
+        if operations:
+            self.results_collection.bulk_write(operations, ordered=False)
+    
+    def save_analysis_job(self, job):
+        """Record a newly queued persona analysis job
+        
+        Raises DuplicateKeyError if the session already has an active job.
+        """
+        self.jobs_collection.insert_one(job)
+    
+    def touch_analysis_jobs(self, job_ids):
+        """Renew the heartbeat of active analysis jobs held by this process"""
+        self.jobs_collection.update_many(
+            {"_id": {"$in": list(job_ids)}, "active": True}, {"$set": {"heartbeat_at": datetime.now()}}
+        )
+    
+    def fail_stale_analysis_job(self, job_id, heartbeat_at, fields):
+        """Mark an active job failed if its heartbeat has not moved since heartbeat_at"""
+        result = self.jobs_collection.update_one(
+            {"_id": job_id, "active": True, "heartbeat_at": heartbeat_at},
+            {"$set": {**fields, "status": "failed", "active": False, "finished_at": datetime.now()}}
+        )
+        return result.modified_count == 1
+    
+    def update_analysis_job(self, job_id, fields):
+        """Set the status (and result or error) of an analysis job"""
+        self.jobs_collection.update_one({"_id": job_id}, {"$set": fields})
+    
+    def get_latest_analysis_job(self, session_id):
+        """Get the most recently queued analysis job of a session, or None"""
+        return self.jobs_collection.find_one(
+            {"session_id": session_id}, sort=[("created_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+        )
+    
+    def pool_stats(self):
+        """Get connection pool counts and per-command latency for this client"""
+        if self.pool_monitor is None:
+            return {}
+        return {
+            "pool": self.pool_monitor.stats(),
+            "commands": self.command_monitor.stats(),
+        }
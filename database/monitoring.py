@@ -0,0 +1,95 @@
+import threading
+from pymongo import monitoring
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connections opened, closed and checked out of a client's pools"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "in_use": self.checked_out,
+                "created_total": self.created,
+                "closed_total": self.closed,
+                "checkout_failures": self.checkout_failures,
+            }
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+    
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+    
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+    
+    # Events the monitor does not need to count
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_check_out_started(self, event):
+        pass
+
+class CommandLatencyMonitor(monitoring.CommandListener):
+    """Records per-command call counts, failures and latency"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+    
+    def _record(self, event, failed):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            stats = self._commands.setdefault(event.command_name, {
+                "calls": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+            })
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(stats, mean_seconds=stats["total_seconds"] / stats["calls"])
+                for name, stats in self._commands.items()
+            }
+    
+    def started(self, event):
+        pass
+    
+    def succeeded(self, event):
+        self._record(event, failed=False)
+    
+    def failed(self, event):
+        self._record(event, failed=True)
@@ -0,0 +1,162 @@
+import atexit
+import threading
+import time
+from bson import ObjectId
+from bson.errors import InvalidDocument
+import pymongo
+from pymongo.errors import BulkWriteError, PyMongoError
+
+DUPLICATE_KEY = 11000
+
+class WriteBehindWriter:
+    """Buffers chat inserts and profile updates and writes them in batches
+    
+    save() returns immediately; a background thread flushes the buffer with
+    one insert_many (and one bulk_write for profile updates) every
+    flush_interval seconds or as soon as max_batch writes are waiting.
+    Exchanges carry their _id and timestamp from the moment they are
+    queued, so readers see them in the order they were saved whatever order
+    they are written in. Writes stay visible through pending() until
+    MongoDB has acknowledged them, which is what lets MongoDB give
+    read-your-writes for the current session. Buffered writes are flushed
+    on close() and at interpreter exit.
+    
+    Retrying a batch that was partly applied must not write anything
+    twice. An exchange whose _id already exists was written by an earlier
+    attempt. A profile update records its exchange's _id in the profile's
+    applied_exchanges, and its filter skips profiles that already have it;
+    the upsert that follows then fails on the unique session_id index,
+    which also means already applied. Any other per-document error is
+    permanent, so that write is dropped rather than retried. A document
+    that cannot be encoded (InvalidDocument, DocumentTooLarge) fails its
+    whole batch before anything is sent, so the batch is then written one
+    document at a time and only that document is dropped. Whatever goes
+    wrong, the thread keeps running and flush() is released.
+    """
+    
+    def __init__(self, chat_collection, profile_collection, flush_interval=0.5, max_batch=500, max_retries=5):
+        self.chat_collection = chat_collection
+        self.profile_collection = profile_collection
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        
+        self._buffer = []
+        self._in_flight = []
+        self._condition = threading.Condition()
+        self._closed = False
+        
+        self._thread = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def save(self, document, profile_update=None):
+        """Queue an exchange document (and its profile update) for writing"""
+        # Assign the id now so readers can merge pending and stored copies
+        document.setdefault("_id", ObjectId())
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind writer is closed")
+            self._buffer.append((document, profile_update))
+            if len(self._buffer) >= self.max_batch:
+                self._condition.notify_all()
+    
+    def pending(self, session_id):
+        """Get the queued or in-flight writes of a session, oldest first"""
+        with self._condition:
+            return [
+                (document, profile_update) for document, profile_update in self._in_flight + self._buffer
+                if document["session_id"] == session_id
+            ]
+    
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._buffer or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+    
+    def close(self, timeout=30):
+        """Flush buffered writes and stop the background thread"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._buffer and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                if not self._buffer:
+                    if self._closed:
+                        return
+                    continue
+                self._in_flight = self._buffer[:self.max_batch]
+                self._buffer = self._buffer[self.max_batch:]
+            
+            try:
+                self._write(self._in_flight)
+            except Exception as e:
+                # Never let one batch stop the thread: flush() would wait forever
+                print(f"Dropping write-behind batch of {len(self._in_flight)} writes: {e!r}")
+            finally:
+                with self._condition:
+                    self._in_flight = []
+                    self._condition.notify_all()
+    
+    def _write(self, batch):
+        """Write one batch, retrying transient failures without applying any write twice"""
+        documents = [document for document, _ in batch]
+        profile_updates = [
+            pymongo.UpdateOne(
+                {"session_id": document["session_id"], "applied_exchanges": {"$ne": document["_id"]}},
+                # Remember enough exchange ids to cover every update of one batch
+                {**profile_update, "$push": {"applied_exchanges": {"$each": [document["_id"]], "$slice": -self.max_batch}}},
+                upsert=True
+            )
+            for document, profile_update in batch if profile_update
+        ]
+        
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                if documents:
+                    self._bulk(self.chat_collection.insert_many, documents, "chat exchange")
+                    documents = []
+                if profile_updates:
+                    self._bulk(self.profile_collection.bulk_write, profile_updates, "profile update")
+                return
+            except PyMongoError as e:
+                print(f"Write-behind batch failed (attempt {attempt}): {e}")
+            time.sleep(min(self.flush_interval * 2 ** attempt, 10))
+        
+        print(f"Dropping {len(documents)} chat exchanges and {len(profile_updates)} profile updates after {self.max_retries} attempts")
+    
+    def _bulk(self, write, items, kind):
+        """Run an unordered bulk write, treating duplicate keys as already written
+        
+        Every other write error is specific to its document and would fail
+        the same way again, so it is reported and dropped.
+        """
+        try:
+            write(items, ordered=False)
+        except InvalidDocument as e:
+            if len(items) == 1:
+                print(f"Dropping {kind} that cannot be encoded: {e}")
+                return
+            # Anything already sent is skipped as a duplicate on the way through
+            for item in items:
+                self._bulk(write, [item], kind)
+        except BulkWriteError as e:
+            if e.details.get("writeConcernErrors"):
+                raise
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != DUPLICATE_KEY:
+                    print(f"Dropping {kind} {error.get('index')}: {error.get('errmsg')}")
@@ -0,0 +1,21 @@
+import argparse
+from ml.preprocess import NLTK_RESOURCES, load_nltk, nltk_data_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the NLTK data the preprocessor needs")
+    parser.add_argument("--dir", type=str, help="Target directory (default: the nltk_data setting or ./nltk_data)")
+    
+    args = parser.parse_args()
+    directory = args.dir or nltk_data_dir()
+    
+    # Run once on a machine with network access; the app and training scripts
+    # only ever read this directory
+    nltk = load_nltk()
+    failed = [name for name in NLTK_RESOURCES if not nltk.download(name, download_dir=directory, quiet=True)]
+    if failed:
+        print(f"Could not download: {', '.join(failed)}")
+    else:
+        print(f"NLTK data saved to {directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+def content_hash(text):
+    """Hash text content for use as a cache key"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def counts_hash(term_counts):
+    """Hash a term-count mapping independently of key order"""
+    return content_hash(json.dumps(sorted(term_counts.items()), ensure_ascii=False))
+
+class PredictionCache:
+    """Probability rows cached by content hash and model version
+    
+    Entries live in a local LRU bounded by max_size and expire after ttl
+    seconds. If a MongoDB collection is given, it is used as a shared second
+    level so replicas reuse each other's predictions; a TTL index on
+    created_at lets MongoDB drop expired entries on its own. created_at is
+    in UTC, which is what the TTL monitor compares it with.
+    """
+    
+    def __init__(self, max_size=10000, ttl=3600, collection=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.collection = collection
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if self.collection is not None:
+            self.collection.create_index("created_at", expireAfterSeconds=int(ttl))
+    
+    def _key(self, key, model_version):
+        return f"{model_version}:{key}"
+    
+    def get(self, key, model_version):
+        """Get a cached probability row, or None on a miss"""
+        cache_key = self._key(key, model_version)
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                stored_at, proba = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(cache_key)
+                    return proba
+                del self._entries[cache_key]
+        
+        if self.collection is None:
+            return None
+        
+        # MongoDB's TTL monitor only runs periodically, so check age here too
+        doc = self.collection.find_one({
+            "_id": cache_key,
+            "created_at": {"$gte": datetime.now(timezone.utc) - timedelta(seconds=self.ttl)},
+        })
+        if doc is None:
+            return None
+        
+        proba = np.asarray(doc["proba"])
+        self._store_local(cache_key, proba)
+        return proba
+    
+    def set(self, key, model_version, proba):
+        """Cache a probability row"""
+        cache_key = self._key(key, model_version)
+        self._store_local(cache_key, proba)
+        
+        if self.collection is not None:
+            self.collection.replace_one(
+                {"_id": cache_key},
+                {
+                    "model_version": model_version,
+                    "proba": [float(p) for p in proba],
+                    "created_at": datetime.now(timezone.utc),
+                },
+                upsert=True
+            )
+    
+    def _store_local(self, cache_key, proba):
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic(), proba)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, current_version=None):
+        """Drop every entry that does not belong to the current model version"""
+        with self._lock:
+            self._entries.clear()
+        
+        if self.collection is not None:
+            self.collection.delete_many({"model_version": {"$ne": current_version}})
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from .preprocess import FastTextPreprocessor, PREPROCESSOR_VERSION
+
+class CorpusCache:
+    """Content-addressed on-disk cache of preprocessed training texts
+    
+    Texts are keyed by the SHA-256 of their raw content, so retraining only
+    preprocesses documents that are new or whose text changed. Each run that
+    adds texts appends one immutable segment directory:
+    
+        segment-000001/hashes.npy   fixed-width hex digests
+        segment-000001/offsets.npy  int64 start offsets, plus the end
+        segment-000001/texts.bin    concatenated UTF-8 preprocessed texts
+    
+    Segments are memory-mapped when read. ids.json maps document ids to the
+    hash of their current text, so changed documents can be reported and
+    compact() can drop texts no document points at any more. The whole
+    cache is discarded if it was built by a different preprocessor version.
+    """
+    
+    def __init__(self, root="ml/corpus_cache"):
+        self.root = root
+        self._segments = []
+        self._index = {}
+        self._ids = {}
+        self._load()
+    
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+    
+    def _load(self):
+        manifest_path = self._path("manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("preprocessor") != PREPROCESSOR_VERSION:
+                print("Preprocessor changed; discarding the corpus cache")
+                shutil.rmtree(self.root)
+        
+        os.makedirs(self.root, exist_ok=True)
+        self._write_json("manifest.json", {"preprocessor": PREPROCESSOR_VERSION})
+        
+        if os.path.exists(self._path("ids.json")):
+            with open(self._path("ids.json")) as f:
+                self._ids = json.load(f)
+        
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith("segment-"):
+                self._open_segment(name)
+    
+    def _open_segment(self, name):
+        hashes = np.load(self._path(name, "hashes.npy"), mmap_mode="r")
+        offsets = np.load(self._path(name, "offsets.npy"), mmap_mode="r")
+        texts_path = self._path(name, "texts.bin")
+        # np.memmap cannot map an empty file
+        texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+        
+        segment = len(self._segments)
+        self._segments.append((offsets, texts))
+        for i, digest in enumerate(hashes):
+            self._index[digest.decode("ascii")] = (segment, i)
+    
+    def _write_json(self, name, data):
+        tmp_path = self._path(f"{name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+    
+    def _get(self, digest):
+        segment, i = self._index[digest]
+        offsets, texts = self._segments[segment]
+        return bytes(texts[offsets[i]:offsets[i + 1]]).decode("utf-8")
+    
+    def _write_segment(self, directory, digests, processed_texts):
+        os.makedirs(directory, exist_ok=True)
+        encoded = [text.encode("utf-8") for text in processed_texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        np.save(os.path.join(directory, "hashes.npy"), np.array(digests, dtype="S64"))
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        with open(os.path.join(directory, "texts.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+    
+    def _append_segment(self, digests, processed_texts):
+        """Write new texts as one segment, then make it visible atomically"""
+        name = f"segment-{len(self._segments) + 1:06d}"
+        tmp_dir = self._path(f"{name}.tmp")
+        self._write_segment(tmp_dir, digests, processed_texts)
+        os.rename(tmp_dir, self._path(name))
+        self._open_segment(name)
+    
+    def preprocess(self, texts, doc_ids=None, preprocessor=None, n_jobs=-1):
+        """Preprocess texts, reusing cached results and storing new ones
+        
+        doc_ids, if given, line up with texts and let the cache report (and
+        later compact) documents whose text changed since the last run.
+        """
+        texts = list(texts)
+        digests = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in self._index and digest not in missing:
+                missing[digest] = text
+        
+        if doc_ids is not None:
+            changed = sum(
+                1 for doc_id, digest in zip(doc_ids, digests)
+                if str(doc_id) in self._ids and self._ids[str(doc_id)] != digest
+            )
+            self._ids.update((str(doc_id), digest) for doc_id, digest in zip(doc_ids, digests))
+            self._write_json("ids.json", self._ids)
+            print(f"Corpus cache: {len(texts)} documents, {len(missing)} new texts to preprocess, {changed} changed documents")
+        else:
+            print(f"Corpus cache: {len(texts)} documents, {len(missing)} new texts to preprocess")
+        
+        if missing:
+            preprocessor = preprocessor or FastTextPreprocessor()
+            processed = preprocessor.preprocess_many(list(missing.values()), n_jobs=n_jobs)
+            self._append_segment(list(missing), processed)
+        
+        return [self._get(digest) for digest in digests]
+    
+    def compact(self):
+        """Rewrite the cache keeping only texts that a known document points at"""
+        live = sorted(set(self._ids.values()) & set(self._index))
+        processed = [self._get(digest) for digest in live]
+        
+        compacted_dir = self._path("compacted.tmp")
+        self._write_segment(compacted_dir, live, processed)
+        
+        self._segments, self._index = [], {}
+        for name in os.listdir(self.root):
+            if name.startswith("segment-"):
+                shutil.rmtree(self._path(name))
+        os.rename(compacted_dir, self._path("segment-000001"))
+        self._open_segment("segment-000001")
+        print(f"Corpus cache compacted to {len(live)} texts")
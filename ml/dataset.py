@@ -0,0 +1,158 @@
+import csv
+import hashlib
+import json
+import os
+import sys
+
+LABEL_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+# Columns of the training snapshot, in file order
+SNAPSHOT_COLUMNS = ["id", "session_id", "text", "persona_label"]
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow; install it with `pip install pyarrow`") from None
+    return pyarrow
+
+def label_format(path):
+    """Get the label file format from its extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LABEL_FORMATS:
+        raise ValueError(f"Unsupported label file {path!r}; expected one of {', '.join(LABEL_FORMATS)}")
+    return LABEL_FORMATS[extension]
+
+def _iter_csv(path):
+    # Conversations can be longer than the csv module's default field limit
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+def _iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _iter_parquet(path, batch_size):
+    pyarrow = _require_pyarrow()
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+def label_record(row):
+    """Normalize one row of a label file to {session_id, messages, persona_label}
+    
+    The label comes from persona_label or persona. The conversation comes
+    from messages (a list, or a JSON list in a CSV cell) or from text /
+    combined_text, split into messages on newlines. Without either,
+    messages is None and the session's stored chat history is used. Rows
+    without a session_id get one derived from their text, so importing the
+    same file twice updates rather than duplicates them.
+    """
+    label = row.get("persona_label") or row.get("persona")
+    if not label:
+        raise ValueError("row has no persona_label or persona")
+    
+    messages = row.get("messages")
+    if isinstance(messages, str):
+        messages = json.loads(messages) if messages.strip() else None
+    if messages is None:
+        text = row.get("text") or row.get("combined_text")
+        messages = str(text).split("\n") if text else None
+    if messages is not None and (
+        not isinstance(messages, list) or not all(isinstance(message, str) for message in messages)
+    ):
+        raise ValueError("messages must be a list of strings")
+    
+    session_id = row.get("session_id")
+    if not session_id:
+        if messages is None:
+            raise ValueError("row has neither a session_id nor any text")
+        digest = hashlib.sha1("\n".join(messages).encode("utf-8")).hexdigest()
+        session_id = f"import-{digest[:24]}"
+    
+    return {"session_id": str(session_id), "messages": messages, "persona_label": str(label)}
+
+def iter_label_batches(path, batch_size=1000):
+    """Stream a CSV, JSONL or Parquet label file as lists of label records
+    
+    Only one batch is held in memory at a time. Rows that cannot be read
+    are reported and skipped.
+    """
+    file_format = label_format(path)
+    if file_format == "parquet":
+        rows = _iter_parquet(path, batch_size)
+    else:
+        rows = _iter_csv(path) if file_format == "csv" else _iter_jsonl(path)
+    
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            batch.append(label_record(row))
+        except ValueError as e:
+            print(f"Skipping row {number} of {path}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def import_labels(db, path, batch_size=1000):
+    """Upsert every labeled session of a label file into the persona collection
+    
+    Rows that carry only a session_id and a label are filled in from the
+    chat history, one query per batch. Returns the number of sessions
+    written and the number skipped for having no messages.
+    """
+    written = skipped = 0
+    for batch in iter_label_batches(path, batch_size):
+        missing = [record["session_id"] for record in batch if record["messages"] is None]
+        if missing:
+            history = db.get_user_messages_for_sessions(missing)
+            for record in batch:
+                if record["messages"] is None:
+                    record["messages"] = history.get(record["session_id"]) or None
+        
+        labels = [record for record in batch if record["messages"]]
+        skipped += len(batch) - len(labels)
+        db.save_persona_labels(labels)
+        written += len(labels)
+    return written, skipped
+
+def export_snapshot(db, path, batch_size=10000):
+    """Write the persona collection to a Parquet training snapshot
+    
+    Documents are streamed from MongoDB and written one row group per
+    batch, so memory stays flat however large the collection is. The file
+    is renamed into place once complete. Returns the number of rows.
+    """
+    pyarrow = _require_pyarrow()
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in SNAPSHOT_COLUMNS])
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    rows = 0
+    try:
+        with pyarrow.parquet.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+            for batch in db.iter_labeled_records(batch_size=batch_size):
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                rows += len(batch)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+def read_snapshot(path):
+    """Read a training snapshot as (texts, labels, doc_ids) lists
+    
+    Only the three training columns are read from the file.
+    """
+    pyarrow = _require_pyarrow()
+    table = pyarrow.parquet.read_table(path, columns=["text", "persona_label", "id"])
+    return (
+        table.column("text").to_pylist(),
+        table.column("persona_label").to_pylist(),
+        table.column("id").to_pylist(),
+    )
@@ -1,6 +1,119 @@
+import re
+from functools import lru_cache
 import numpy as np
-import pandas as pd
-from textblob import TextBlob
+
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+# Bump when extract_features_batch output changes so cached fitted transformers are rebuilt
+FEATURES_VERSION = "2"
+
+# Column order of the batch feature matrix, matching extract_all_features
+FEATURE_COLUMNS = [
+    'text_length', 'word_count', 'avg_word_length', 'sentiment_polarity', 'sentiment_subjectivity',
+    'capital_ratio', 'punct_ratio', 'question_ratio', 'exclamation_ratio',
+]
+
+@lru_cache(maxsize=None)
+def _sentiment_lexicon():
+    """Load TextBlob's pattern sentiment lexicon once"""
+    from textblob.en import sentiment
+    sentiment.load()
+    return sentiment
+
+@lru_cache(maxsize=None)
+def _emoticon_polarities():
+    """Polarity of each lowercase emoticon, first match winning as in TextBlob"""
+    from textblob._text import EMOTICONS
+    polarities = {}
+    for (_, polarity), emoticons in EMOTICONS.items():
+        for emoticon in emoticons:
+            polarities.setdefault(emoticon.lower(), polarity)
+    return polarities
+
+@lru_cache(maxsize=200000)
+def sentiment_tokens(chunk):
+    """Split a whitespace-free chunk of text into lowercase tokens as TextBlob's sentiment does"""
+    return tuple(" ".join(_sentiment_lexicon().tokenizer(chunk)).lower().split())
+
+@lru_cache(maxsize=200000)
+def word_sentiment(word):
+    """Get the (polarity, subjectivity, intensity, is_modifier) of a lowercase token, or None if unknown"""
+    lexicon = _sentiment_lexicon()
+    entry = lexicon.get(word)
+    if not entry or None not in entry:
+        return None
+    polarity, subjectivity, intensity = entry[None][:3]
+    # Adverbs intensify the word that follows ("very good")
+    return polarity, subjectivity, intensity, any(modifier in entry for modifier in lexicon.modifiers)
+
+def text_sentiment(tokens):
+    """Mean (polarity, subjectivity) of a token sequence, following TextBlob's rules
+    
+    A port of pattern's Sentiment.assessments for untagged words: a
+    modifier multiplies the next known word's scores by its intensity, a
+    negation (no, not, n't, never) flips the next known word to -0.5 times
+    its polarity, "!" boosts the previous assessment by 1.25 and emoticons
+    count as words of their own.
+    """
+    from textblob._text import PUNCTUATION
+    lexicon = _sentiment_lexicon()
+    emoticons = _emoticon_polarities()
+    # [polarity, subjectivity, intensity, negated] per assessed chunk of words
+    assessments = []
+    modifier = negation = None
+    for word in tokens:
+        scores = word_sentiment(word)
+        if scores is not None:
+            polarity, subjectivity, intensity, is_modifier = scores
+            if modifier is None:
+                assessments.append([polarity, subjectivity, intensity, False])
+            else:
+                last = assessments[-1]
+                last[0] = max(-1.0, min(polarity * last[2], 1.0))
+                last[1] = max(-1.0, min(subjectivity * last[2], 1.0))
+                last[2] = intensity
+            if negation is not None:
+                assessments[-1][2] = 1.0 / assessments[-1][2]
+                assessments[-1][3] = True
+            modifier = word if is_modifier else None
+            negation = word if word in lexicon.negations else None
+            continue
+        
+        if word in lexicon.negations:
+            negation = word
+        elif negation and len(word.strip("'")) > 1:
+            # Negation carries across small words ("not a good")
+            negation = None
+        if negation is not None and modifier is not None and lexicon.modifier(modifier):
+            # "really not good"
+            assessments[-1][3] = True
+            negation = None
+        elif modifier and len(word) > 2:
+            modifier = None
+        if word == "!" and assessments:
+            assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, 1.0))
+        if word == "(!)":
+            assessments.append([0.0, 1.0, 1.0, False])
+        if not word.isalpha() and len(word) <= 5 and word not in PUNCTUATION and word in emoticons:
+            assessments.append([emoticons[word], 1.0, 1.0, False])
+    
+    if not assessments:
+        return 0.0, 0.0
+    # "not good" is slightly bad, "not bad" slightly good
+    polarity = sum(p * -0.5 if negated else p for p, _, _, negated in assessments)
+    subjectivity = sum(s for _, s, _, _ in assessments)
+    return polarity / len(assessments), subjectivity / len(assessments)
+
+def _char_class_tables(codepoints):
+    """Classify each distinct code point once and return per-code-point lookup tables"""
+    present = np.flatnonzero(np.bincount(codepoints)) if len(codepoints) else np.array([], dtype=np.int64)
+    size = int(present[-1]) + 1 if len(present) else 1
+    tables = {name: np.zeros(size, dtype=bool) for name in ('upper', 'punct', 'space')}
+    chars = [chr(c) for c in present]
+    tables['upper'][present] = [c.isupper() for c in chars]
+    tables['punct'][present] = [PUNCTUATION_PATTERN.match(c) is not None for c in chars]
+    tables['space'][present] = [c.isspace() for c in chars]
+    return tables
 
 class FeatureExtractor:
     def __init__(self):
@@ -14,13 +127,14 @@ class FeatureExtractor:
         features['text_length'] = len(text)
         
         # Word count
-        features['word_count'] = len(text.split())
+        words = text.split()
+        features['word_count'] = len(words)
         
         # Average word length
-        words = text.split()
         features['avg_word_length'] = np.mean([len(word) for word in words]) if words else 0
         
         # Sentiment analysis
+        from textblob import TextBlob
         blob = TextBlob(text)
         features['sentiment_polarity'] = blob.sentiment.polarity
         features['sentiment_subjectivity'] = blob.sentiment.subjectivity
@@ -35,8 +149,7 @@ class FeatureExtractor:
         features['capital_ratio'] = sum(1 for c in text if c.isupper()) / len(text) if text else 0
         
         # Punctuation frequency
-        import re
-        punctuation = re.findall(r'[^\w\s]', text)
+        punctuation = PUNCTUATION_PATTERN.findall(text)
         features['punct_ratio'] = len(punctuation) / len(text) if text else 0
         
         # Question mark and exclamation frequency
@@ -50,4 +163,120 @@ class FeatureExtractor:
         features = {}
         features.update(self.extract_basic_features(text))
         features.update(self.extract_stylometric_features(text))
-        return features
\ No newline at end of file
+        return features
+    
+    def extract_aggregates(self, text):
+        """Extract additive counts for one message so they can be summed across a session"""
+        from textblob import TextBlob
+        words = text.split()
+        sentiment = TextBlob(text).sentiment
+        return {
+            'char_count': len(text),
+            'word_count': len(words),
+            'word_char_count': sum(len(word) for word in words),
+            'capital_count': sum(1 for c in text if c.isupper()),
+            'punct_count': len(PUNCTUATION_PATTERN.findall(text)),
+            'question_count': text.count('?'),
+            'exclamation_count': text.count('!'),
+            'sentiment_polarity_sum': sentiment.polarity,
+            'sentiment_subjectivity_sum': sentiment.subjectivity,
+        }
+    
+    def features_from_aggregates(self, aggregates, message_count):
+        """Rebuild extract_all_features output from summed per-message aggregates
+        
+        Lengths and ratios match the newline-joined session text exactly;
+        sentiment is the mean of the per-message scores.
+        """
+        features = {}
+        if not message_count:
+            return features
+        
+        # Messages are joined with a newline, one separator between each pair
+        text_length = aggregates.get('char_count', 0) + message_count - 1
+        word_count = aggregates.get('word_count', 0)
+        
+        features['text_length'] = text_length
+        features['word_count'] = word_count
+        features['avg_word_length'] = aggregates.get('word_char_count', 0) / word_count if word_count else 0
+        features['sentiment_polarity'] = aggregates.get('sentiment_polarity_sum', 0) / message_count
+        features['sentiment_subjectivity'] = aggregates.get('sentiment_subjectivity_sum', 0) / message_count
+        
+        for name in ['capital', 'punct', 'question', 'exclamation']:
+            features[f'{name}_ratio'] = aggregates.get(f'{name}_count', 0) / text_length if text_length else 0
+        
+        return features
+    
+    def extract_features_batch(self, texts, chunk_size=10000):
+        """Extract all features for many texts as a columnar DataFrame
+        
+        Columns follow FEATURE_COLUMNS. Length, word and character-class
+        features are computed with numpy over the code points of a whole
+        chunk at once and equal the per-text extractors exactly. Sentiment
+        applies TextBlob's lexicon and rules (see text_sentiment) to tokens
+        cached per whitespace-separated chunk; it matches TextBlob except
+        for emoticons typed with spaces inside them.
+        """
+        import pandas as pd
+        texts = ["" if text is None else str(text) for text in texts]
+        chunks = [
+            self._extract_chunk(texts[start:start + chunk_size])
+            for start in range(0, len(texts), chunk_size)
+        ]
+        if not chunks:
+            return pd.DataFrame(columns=FEATURE_COLUMNS, dtype=np.float64)
+        return pd.concat(chunks, ignore_index=True)
+    
+    def _extract_chunk(self, texts):
+        import pandas as pd
+        n = len(texts)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+        codepoints = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32)
+        text_ids = np.repeat(np.arange(n), lengths)
+        tables = _char_class_tables(codepoints)
+        
+        def per_text(mask):
+            return np.bincount(text_ids, weights=mask, minlength=n)
+        
+        is_space = tables['space'][codepoints]
+        
+        # A word starts at a non-space character preceded by a space or by the
+        # start of its text, which is exactly how str.split() counts words
+        follows_space = np.ones(len(codepoints), dtype=bool)
+        follows_space[1:] = is_space[:-1]
+        starts = np.cumsum(lengths) - lengths
+        follows_space[starts[lengths > 0]] = True
+        word_count = per_text(~is_space & follows_space)
+        word_chars = per_text(~is_space)
+        
+        safe_length = np.maximum(lengths, 1)
+        polarity, subjectivity = self._lexicon_sentiment(texts)
+        
+        return pd.DataFrame({
+            'text_length': lengths.astype(np.float64),
+            'word_count': word_count,
+            'avg_word_length': np.divide(word_chars, word_count, out=np.zeros(n), where=word_count > 0),
+            'sentiment_polarity': polarity,
+            'sentiment_subjectivity': subjectivity,
+            'capital_ratio': per_text(tables['upper'][codepoints]) / safe_length,
+            'punct_ratio': per_text(tables['punct'][codepoints]) / safe_length,
+            'question_ratio': per_text(codepoints == ord('?')) / safe_length,
+            'exclamation_ratio': per_text(codepoints == ord('!')) / safe_length,
+        }, columns=FEATURE_COLUMNS)
+    
+    def _lexicon_sentiment(self, texts):
+        """TextBlob polarity and subjectivity per text"""
+        polarity = np.zeros(len(texts))
+        subjectivity = np.zeros(len(texts))
+        for i, text in enumerate(texts):
+            tokens = [token for chunk in text.split() for token in sentiment_tokens(chunk)]
+            polarity[i], subjectivity[i] = text_sentiment(tokens)
+        return polarity, subjectivity
+
+def __getattr__(name):
+    # The sklearn pipeline step moved to ml.transformers; resolve it lazily so
+    # older code and pickled models keep working without importing sklearn here
+    if name == "StylometricTransformer":
+        from .transformers import StylometricTransformer
+        return StylometricTransformer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,60 +1,238 @@
 import joblib
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.pipeline import Pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
 import os
+from datetime import datetime
+from .cache import content_hash, counts_hash
+from .registry import get_registry
+from .store import ModelStore
+from utils.metrics import timed
+
+VECTORIZERS = ["tfidf", "hashing"]
+CLASSIFIERS = ["forest", "linear"]
 
 class PersonaModel:
-    def __init__(self):
+    def __init__(self, cache=None, registry=None, store=None):
         self.model_path = "ml/persona_model.joblib"
-        self.pipeline = None
-        self.persona_categories = []
-        self.load_model()
+        self.cache = cache
+        self.registry = registry or get_registry()
+        self.store = store or ModelStore()
+        # A pipeline created or trained by this instance takes precedence over
+        # the shared one the registry loads from disk
+        self._local = None
+    
+    def current(self):
+        """Get the model in use as a dict with pipeline, categories and version"""
+        if self._local is not None:
+            return self._local
+        return self.registry.get(self.model_path)
+    
+    @property
+    def pipeline(self):
+        artifact = self.current()
+        return artifact["pipeline"] if artifact else None
+    
+    @property
+    def persona_categories(self):
+        artifact = self.current()
+        return artifact["categories"] if artifact else []
+    
+    @property
+    def model_version(self):
+        artifact = self.current()
+        return artifact["version"] if artifact else None
     
     def load_model(self):
-        """Load the trained model if it exists"""
-        if os.path.exists(self.model_path):
-            try:
-                loaded_model = joblib.load(self.model_path)
-                self.pipeline = loaded_model["pipeline"]
-                self.persona_categories = loaded_model["categories"]
-                print("Model loaded successfully")
-                return True
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                return False
-        else:
+        """Check that a trained model is available, loading it on first use"""
+        try:
+            artifact = self.current()
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            return False
+        
+        if artifact is None:
             print("No trained model found")
             return False
+        return True
             
-    def create_pipeline(self):
-        """Create a new model pipeline"""
-        self.pipeline = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2))),
-            ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))
+    @property
+    def expects_raw_text(self):
+        """Whether the pipeline preprocesses text itself and must be given raw text"""
+        artifact = self.current()
+        return bool(artifact and artifact.get("raw_text"))
+    
+    def create_pipeline(self, vectorizer="tfidf", classifier="forest", stylometric=False, memory=None):
+        """Create a new model pipeline
+        
+        vectorizer: "tfidf" learns a 5000-term vocabulary; "hashing" is
+            stateless and hashes n-grams into a fixed 2**18 columns
+        classifier: "forest" (RandomForest) or "linear" (logistic regression)
+        stylometric: join FeatureExtractor features of the raw text onto the
+            text features; the pipeline then preprocesses text itself and
+            expects raw text as input
+        memory: joblib cache directory for fitted transformers, so refitting
+            on an unchanged corpus reuses the cached TF-IDF matrix
+        
+        Text features are float32 CSR and stay sparse through the union.
+        """
+        if vectorizer not in VECTORIZERS:
+            raise ValueError(f"Unknown vectorizer '{vectorizer}', expected one of {VECTORIZERS}")
+        if classifier not in CLASSIFIERS:
+            raise ValueError(f"Unknown classifier '{classifier}', expected one of {CLASSIFIERS}")
+        
+        # scikit-learn is only imported once a pipeline is built or loaded
+        from sklearn.preprocessing import MaxAbsScaler
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import Pipeline, FeatureUnion
+        from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer
+        from .transformers import PreprocessTransformer, StylometricTransformer
+        
+        if vectorizer == "tfidf":
+            text_steps = [
+                ('tfidf', TfidfVectorizer(max_features=5000, ngram_range=(1, 2), dtype=np.float32))
+            ]
+        else:
+            text_steps = [
+                ('hashing', HashingVectorizer(
+                    n_features=2 ** 18, ngram_range=(1, 2), alternate_sign=False, norm=None, dtype=np.float32
+                )),
+                ('idf', TfidfTransformer())
+            ]
+        
+        if classifier == "forest":
+            estimator = RandomForestClassifier(n_estimators=100, random_state=42)
+        else:
+            estimator = LogisticRegression(max_iter=1000)
+        
+        if stylometric:
+            steps = [
+                ('features', FeatureUnion([
+                    ('text', Pipeline([('preprocess', PreprocessTransformer())] + text_steps)),
+                    ('style', Pipeline([
+                        ('stylometric', StylometricTransformer()),
+                        ('scale', MaxAbsScaler())
+                    ]))
+                ])),
+                ('classifier', estimator)
+            ]
+        else:
+            steps = text_steps + [('classifier', estimator)]
+        
+        self._local = {
+            "pipeline": Pipeline(steps, memory=memory),
+            "categories": [],
+            "version": None,
+            "raw_text": stylometric,
+            "options": {"vectorizer": vectorizer, "classifier": classifier, "stylometric": stylometric},
+        }
+        
+    def adopt_pipeline(self, pipeline, **options):
+        """Use an already fitted text pipeline (for example the winner of a search)"""
+        self._local = {
+            "pipeline": pipeline,
+            "categories": pipeline.classes_.tolist(),
+            "version": None,
+            "options": options,
+        }
+    
+    def create_streaming_pipeline(self):
+        """Create a pipeline that can be trained one batch at a time
+        
+        The hashing vectorizer is stateless and the SGD classifier supports
+        partial_fit, so memory does not grow with the number of examples.
+        Train it with partial_fit rather than train.
+        """
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.pipeline import Pipeline
+        from sklearn.feature_extraction.text import HashingVectorizer
+        pipeline = Pipeline([
+            ('hashing', HashingVectorizer(
+                n_features=2 ** 20, ngram_range=(1, 2), alternate_sign=False, dtype=np.float32
+            )),
+            ('classifier', SGDClassifier(loss="log_loss", alpha=1e-6, random_state=42))
         ])
+        self._local = {
+            "pipeline": pipeline,
+            "categories": [],
+            "version": None,
+            "options": {"vectorizer": "hashing", "classifier": "sgd", "stylometric": False},
+        }
+    
+    def partial_fit(self, texts, labels, classes):
+        """Update a streaming pipeline with one batch of preprocessed texts"""
+        if self._local is None:
+            self.create_streaming_pipeline()
         
+        X = self.pipeline.named_steps["hashing"].transform(texts)
+        classifier = self.pipeline.named_steps["classifier"]
+        classifier.partial_fit(X, labels, classes=classes)
+        self._local["categories"] = classifier.classes_.tolist()
+    
     def train(self, texts, labels):
         """Train the model with text data and persona labels"""
-        if not self.pipeline:
+        # Never refit the shared pipeline other models may be predicting with
+        if self._local is None:
             self.create_pipeline()
         
-        # Get unique persona categories
-        self.persona_categories = list(set(labels))
-        
-        # Train the model
+        # Train the model; the transformer cache is only needed while fitting
         self.pipeline.fit(texts, labels)
+        self.pipeline.set_params(memory=None)
         
-        # Save the model
-        model_data = {
-            "pipeline": self.pipeline,
-            "categories": self.persona_categories
-        }
-        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-        joblib.dump(model_data, self.model_path)
+        # Categories in the classifier's column order of predict_proba
+        self._local["categories"] = self.pipeline.classes_.tolist()
+        
+        self.save()
         print(f"Model trained and saved with {len(self.persona_categories)} categories")
+    
+    def save(self, path=None, **extra):
+        """Save the model built by this instance
+        
+        Saving to model_path stores a new version in the model store,
+        publishes it and prunes old versions; any other path (a checkpoint, for example) is written
+        directly and leaves the served model and cache untouched. Either way
+        the file is written next to its destination and renamed into place,
+        so processes watching the path never load a partially written file.
+        Extra keyword arguments are stored alongside the pipeline.
+        """
+        path = path or self.model_path
+        model_data = dict(self._local, **extra)
+        if path != self.model_path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            joblib.dump(model_data, tmp_path)
+            os.replace(tmp_path, path)
+            return
+        
+        self._local["version"] = model_data["version"] = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self.store.save(model_data)
+        self.store.publish(model_data["version"], self.model_path)
+        self._published(model_data["version"])
+        self.store.prune(self.model_path)
+    
+    def rollback(self, version=None):
+        """Serve an earlier stored version, by default the one before the current"""
+        version = self.store.rollback(self.model_path, version)
+        self._local = None
+        self._published(version)
+        return version
+    
+    def _published(self, version):
+        """Make every process pick up a newly served version"""
+        self.registry.invalidate(self.model_path)
+        # Predictions from any other model must not be served again
+        if self.cache:
+            self.cache.invalidate(version)
+    
+    def load_checkpoint(self, path):
+        """Resume from a checkpoint written by save(), returning its extra fields"""
+        checkpoint = joblib.load(path)
+        self._local = {
+            key: checkpoint[key] for key in ("pipeline", "categories", "version", "options")
+            if key in checkpoint
+        }
+        return checkpoint
         
+    @timed("model.predict")
     def predict(self, text):
         """Predict persona from text"""
         if not self.pipeline:
@@ -70,17 +248,148 @@ class PersonaModel:
             predictions = self.pipeline.predict(text)
             return predictions
     
+    @timed("model.predict_proba")
     def predict_proba(self, text):
-        """Get probability distribution over persona categories"""
+        """Get probability distribution over persona categories
+        
+        A single text gives one dict mapping categories to probabilities; a
+        list of texts gives one such dict per text. Use predict_batch for the
+        probabilities as a matrix.
+        """
         if not self.pipeline:
             raise ValueError("Model not loaded or trained")
-            
-        # For single text input, wrap in list
-        if isinstance(text, str):
-            proba = self.pipeline.predict_proba([text])[0]
-        else:
-            proba = self.pipeline.predict_proba(text)
-            
-        # Create a dictionary mapping categories to probabilities
-        result = {cat: float(prob) for cat, prob in zip(self.persona_categories, proba[0])}
-        return result
+        
+        texts = [text] if isinstance(text, str) else text
+        categories, proba = self._predict_batch(texts)
+        results = [dict(zip(categories, row.tolist())) for row in proba]
+        return results[0] if isinstance(text, str) else results
+    
+    def set_n_jobs(self, n_jobs):
+        """Set the number of cores the classifier uses for prediction"""
+        if self.pipeline and "n_jobs" in self.pipeline.named_steps["classifier"].get_params():
+            self.pipeline.set_params(classifier__n_jobs=n_jobs)
+    
+    @property
+    def classes(self):
+        """Persona labels in the column order of the probability matrix"""
+        return self.pipeline.classes_.tolist()
+    
+    @timed("model.predict_batch")
+    def predict_batch(self, texts, chunk_size=None):
+        """Score many texts in a single predict_proba pass
+        
+        Returns the probability matrix (one row per text), the index of the
+        predicted class for each row, and the categories labeling the
+        columns, all from the same model even if it is swapped meanwhile. With
+        chunk_size set, very large inputs are transformed and scored that many
+        texts at a time, bounding the memory of the intermediate feature
+        matrices; the result is still one matrix.
+        """
+        if not self.pipeline:
+            raise ValueError("Model not loaded or trained")
+        
+        categories, proba = self._predict_batch(texts, chunk_size)
+        return proba, proba.argmax(axis=1), categories
+    
+    def _predict_batch(self, texts, chunk_size=None):
+        """Get the categories and probability matrix from one model snapshot"""
+        # Use one snapshot so a hot swap cannot mix models within a call
+        artifact = self.current()
+        pipeline = artifact["pipeline"]
+        texts = list(texts)
+        if not texts:
+            return artifact["categories"], np.empty((0, len(pipeline.classes_)))
+        
+        proba = self._cached_proba(
+            artifact["version"],
+            [content_hash(text) for text in texts],
+            lambda missing: self._chunked_proba(pipeline, [texts[i] for i in missing], chunk_size)
+        )
+        return artifact["categories"], proba
+    
+    def _chunked_proba(self, pipeline, texts, chunk_size=None):
+        """Run predict_proba over texts, at most chunk_size at a time"""
+        if not chunk_size or len(texts) <= chunk_size:
+            return pipeline.predict_proba(texts)
+        
+        proba = np.empty((len(texts), len(pipeline.classes_)))
+        for start in range(0, len(texts), chunk_size):
+            proba[start:start + chunk_size] = pipeline.predict_proba(texts[start:start + chunk_size])
+        return proba
+    
+    def _cached_proba(self, model_version, keys, compute):
+        """Assemble probability rows from the cache, computing misses in one call
+        
+        compute receives the row indices that missed and must return their
+        probability rows in the same order.
+        """
+        if not self.cache:
+            return compute(list(range(len(keys))))
+        
+        rows = [self.cache.get(key, model_version) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            for i, row in zip(missing, compute(missing)):
+                self.cache.set(keys[i], model_version, row)
+                rows[i] = row
+        return np.vstack(rows)
+    
+    def build_analyzer(self):
+        """Get the n-gram analyzer of the model's vectorizer, if it has one"""
+        if self.pipeline and "tfidf" in self.pipeline.named_steps:
+            return self.pipeline.named_steps["tfidf"].build_analyzer()
+        return None
+    
+    @timed("model.predict_batch_from_counts")
+    def predict_batch_from_counts(self, term_counts_list):
+        """Score precomputed n-gram counts without re-tokenizing any text
+        
+        Each item maps analyzer terms to counts, as kept by ProfileBuilder.
+        The counts are weighted exactly as TfidfVectorizer.transform would
+        weight the same terms. Returns the same as predict_batch.
+        """
+        artifact = self.current()
+        if not artifact or not artifact["pipeline"]:
+            raise ValueError("Model not loaded or trained")
+        if "tfidf" not in artifact["pipeline"].named_steps:
+            raise ValueError("Model pipeline has no TF-IDF vectorizer")
+        
+        proba = self._cached_proba(
+            artifact["version"],
+            [counts_hash(term_counts) for term_counts in term_counts_list],
+            lambda missing: self._predict_counts(
+                artifact["pipeline"], [term_counts_list[i] for i in missing]
+            )
+        )
+        return proba, proba.argmax(axis=1), artifact["categories"]
+    
+    def _predict_counts(self, pipeline, term_counts_list):
+        """Weight term counts with the fitted idf and run the classifier"""
+        from scipy.sparse import csr_matrix
+        from sklearn.preprocessing import normalize
+        tfidf = pipeline.named_steps["tfidf"]
+        vocabulary = tfidf.vocabulary_
+        
+        rows, cols, values = [], [], []
+        for row, term_counts in enumerate(term_counts_list):
+            for term, count in term_counts.items():
+                col = vocabulary.get(term)
+                if col is not None and count > 0:
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(count)
+        
+        X = csr_matrix(
+            (np.asarray(values, dtype=tfidf.dtype), (rows, cols)),
+            shape=(len(term_counts_list), len(vocabulary))
+        )
+        X.sum_duplicates()
+        if tfidf.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if tfidf.use_idf:
+            X.data *= tfidf.idf_[X.indices]
+        if tfidf.norm is not None:
+            X = normalize(X, norm=tfidf.norm, copy=False)
+        
+        return pipeline.named_steps["classifier"].predict_proba(X)
@@ -1,23 +1,97 @@
+import os
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-import streamlit as st
-
-# Download NLTK resources if not already downloaded
-try:
-    nltk.data.find('corpora/stopwords')
-    nltk.data.find('corpora/wordnet')
-except LookupError:
-    nltk.download('stopwords')
-    nltk.download('wordnet')
-    nltk.download('punkt')
+from functools import lru_cache
+from utils.config import config
+from utils.metrics import timed
+
+# NLTK data is read from this directory (or the nltk_data setting) before
+# NLTK's default locations; nothing is downloaded at runtime. Populate it
+# with `python download_nltk_data.py`.
+DEFAULT_NLTK_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data")
+
+# NLTK resources used by TextPreprocessor, by name and data path
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+    "omw-1.4": "corpora/omw-1.4",
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+}
+
+# Bump when preprocessing output changes so cached preprocessed corpora are rebuilt
+PREPROCESSOR_VERSION = "1"
+
+# URL, punctuation and number removal from TextPreprocessor.preprocess as a
+# single pass; none of the alternatives can overlap the start of a URL, so
+# deleting them together gives the same text as the sequential passes
+CLEANUP_PATTERN = re.compile(r'https?://\S+|www\.\S+|[^\w\s]|\d+')
+
+# Once punctuation is gone, the only splits nltk.word_tokenize still makes
+# beyond whitespace are these NLTKWordTokenizer contractions
+CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+def nltk_data_dir():
+    """Directory NLTK resources are read from first"""
+    return config.get("nltk_data", DEFAULT_NLTK_DATA)
+
+def load_nltk():
+    """Import NLTK with the configured data directory on its search path"""
+    import nltk
+    data_dir = nltk_data_dir()
+    if data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, data_dir)
+    return nltk
+
+def punkt_resource():
+    """The Punkt data nltk.word_tokenize loads: punkt_tab from NLTK 3.8.2, punkt before"""
+    load_nltk()
+    from nltk.tokenize import punkt
+    return "punkt_tab" if hasattr(punkt, "PunktTokenizer") else "punkt"
+
+def require_nltk_data(names=("stopwords", "wordnet")):
+    """Raise LookupError naming any missing NLTK resource, without downloading it"""
+    nltk = load_nltk()
+    missing = []
+    for name in names:
+        try:
+            nltk.data.find(NLTK_RESOURCES[name])
+        except LookupError:
+            missing.append(name)
+    if missing:
+        raise LookupError(
+            f"NLTK data not found: {', '.join(missing)}. Run `python download_nltk_data.py` "
+            f"or point the nltk_data setting (NLTK_DATA) at a directory that has it."
+        )
+    return nltk
+
+def _preprocess_slice(preprocessor_class, texts):
+    """Preprocess a slice of texts in a worker process"""
+    preprocessor = preprocessor_class()
+    return [preprocessor.preprocess(text) for text in texts]
 
 class TextPreprocessor:
+    # Whether preprocess() tokenizes with nltk.word_tokenize, which needs Punkt data
+    uses_word_tokenize = True
+    
     def __init__(self):
+        names = ("stopwords", "wordnet")
+        if self.uses_word_tokenize:
+            names += (punkt_resource(),)
+        nltk = require_nltk_data(names)
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+        self.word_tokenize = nltk.word_tokenize
         self.stop_words = set(stopwords.words('english'))
         self.lemmatizer = WordNetLemmatizer()
         
+    @timed("preprocess.preprocess")
     def preprocess(self, text):
         """Clean and preprocess text data"""
         # Convert to lowercase
@@ -33,7 +107,7 @@ class TextPreprocessor:
         text = re.sub(r'\d+', '', text)
         
         # Tokenize
-        tokens = nltk.word_tokenize(text)
+        tokens = self.word_tokenize(text)
         
         # Remove stopwords and lemmatize
         cleaned_tokens = [self.lemmatizer.lemmatize(token) for token in tokens if token not in self.stop_words]
@@ -41,4 +115,63 @@ class TextPreprocessor:
         # Join tokens back into string
         cleaned_text = ' '.join(cleaned_tokens)
         
-        return cleaned_text
\ No newline at end of file
+        return cleaned_text
+    
+    @timed("preprocess.preprocess_many")
+    def preprocess_many(self, texts, n_jobs=1):
+        """Preprocess a list of texts, optionally spread across a process pool
+        
+        n_jobs follows the joblib convention (-1 uses all cores). Results are
+        returned in input order.
+        """
+        from joblib import Parallel, delayed, effective_n_jobs
+        texts = list(texts)
+        n_slices = min(len(texts), effective_n_jobs(n_jobs))
+        if n_slices < 2:
+            return [self.preprocess(text) for text in texts]
+        
+        slices = [texts[i::n_slices] for i in range(n_slices)]
+        processed = Parallel(n_jobs=n_slices)(
+            delayed(_preprocess_slice)(type(self), chunk) for chunk in slices
+        )
+        
+        # Undo the round-robin split so results line up with the input order
+        ordered = [None] * len(texts)
+        for i, chunk in enumerate(processed):
+            ordered[i::n_slices] = chunk
+        return ordered
+
+class FastTextPreprocessor(TextPreprocessor):
+    """High-throughput TextPreprocessor with token-for-token identical output
+    
+    Cleanup runs as one compiled regex pass, tokenization is a whitespace
+    split plus the contraction table above, and lemmas are memoized in a
+    bounded LRU cache keyed by token.
+    """
+    
+    uses_word_tokenize = False
+    
+    def __init__(self, lemma_cache_size=100000):
+        super().__init__()
+        self.lemmatize = lru_cache(maxsize=lemma_cache_size)(self.lemmatizer.lemmatize)
+    
+    @timed("preprocess.preprocess")
+    def preprocess(self, text):
+        """Clean and preprocess text data"""
+        text = CLEANUP_PATTERN.sub('', text.lower())
+        
+        cleaned_tokens = []
+        for word in text.split():
+            for token in CONTRACTIONS.get(word, (word,)):
+                if token not in self.stop_words:
+                    cleaned_tokens.append(self.lemmatize(token))
+        
+        return ' '.join(cleaned_tokens)
+
+def __getattr__(name):
+    # The sklearn pipeline step moved to ml.transformers; resolve it lazily so
+    # older code and pickled models keep working without importing sklearn here
+    if name == "PreprocessTransformer":
+        from .transformers import PreprocessTransformer
+        return PreprocessTransformer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,69 @@
+from collections import Counter
+from datetime import datetime
+from .features import FeatureExtractor
+from .preprocess import TextPreprocessor
+
+class ProfileBuilder:
+    """Builds append-only persona profile updates from single messages
+    
+    A profile keeps running state for one session so that analysis never has
+    to re-read or re-preprocess the whole conversation:
+    
+    - message_count / token_count: totals over the session
+    - term_counts: n-gram counts produced by the model's TF-IDF analyzer
+    - features: additive FeatureExtractor aggregates
+    """
+    
+    def __init__(self, preprocessor=None, analyzer=None):
+        self.preprocessor = preprocessor or TextPreprocessor()
+        self.feature_extractor = FeatureExtractor()
+        # Must match the analyzer of the model's vectorizer so that stored
+        # counts map onto its vocabulary
+        if analyzer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            analyzer = TfidfVectorizer(ngram_range=(1, 2)).build_analyzer()
+        self.analyzer = analyzer
+    
+    def _message_counts(self, user_message):
+        """Token count, n-gram counts and feature aggregates of one message"""
+        processed_text = self.preprocessor.preprocess(user_message)
+        term_counts = Counter(self.analyzer(processed_text))
+        aggregates = self.feature_extractor.extract_aggregates(user_message)
+        return len(processed_text.split()), term_counts, aggregates
+    
+    def message_update(self, user_message):
+        """Build the MongoDB update that folds one new message into a profile"""
+        token_count, term_counts, aggregates = self._message_counts(user_message)
+        
+        increments = {
+            "message_count": 1,
+            "token_count": token_count,
+        }
+        increments.update({f"term_counts.{term}": count for term, count in term_counts.items()})
+        increments.update({f"features.{name}": value for name, value in aggregates.items()})
+        
+        return {
+            "$inc": increments,
+            "$set": {"updated_at": datetime.now()},
+        }
+    
+    def history_profile(self, user_messages):
+        """Build the profile that message_update would have produced for every message of a session"""
+        profile = {"message_count": 0, "token_count": 0, "term_counts": Counter(), "features": Counter()}
+        for user_message in user_messages:
+            token_count, term_counts, aggregates = self._message_counts(user_message)
+            profile["message_count"] += 1
+            profile["token_count"] += token_count
+            profile["term_counts"].update(term_counts)
+            profile["features"].update(aggregates)
+        
+        profile["term_counts"] = dict(profile["term_counts"])
+        profile["features"] = dict(profile["features"])
+        profile["updated_at"] = datetime.now()
+        return profile
+    
+    def profile_features(self, profile):
+        """Get the session-level stylometric features from a stored profile"""
+        return self.feature_extractor.features_from_aggregates(
+            profile.get("features", {}), profile.get("message_count", 0)
+        )
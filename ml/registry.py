@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+import joblib
+from .store import ModelStore
+
+class ModelRegistry:
+    """Process-wide store of loaded model artifacts
+    
+    Each model file is deserialized once, on first use, and shared by every
+    PersonaModel in the process. Large numpy arrays are memory-mapped
+    read-only, so worker processes loading the same file share its pages
+    through the OS page cache. The file is re-checked at most every
+    check_interval seconds; when it changes, the new artifact is loaded in
+    full and then swapped in with a single reference assignment, so readers
+    always see either the old or the new model. Files whose version is in
+    the model store are checked against its checksum; a file that fails to
+    load or verify leaves the previous model in service.
+    """
+    
+    def __init__(self, check_interval=5.0, mmap_mode="r", store=None):
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self.store = store or ModelStore()
+        self._artifacts = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+    
+    def _signature(self, path):
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    
+    def get(self, path):
+        """Get the artifact stored at path, or None if there is no model file"""
+        entry = self._artifacts.get(path)
+        now = time.monotonic()
+        if entry is not None and now - self._checked_at.get(path, 0) < self.check_interval:
+            return entry[1]
+        
+        with self._lock:
+            self._checked_at[path] = now
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                # Keep serving the last good model if the file disappears
+                return entry[1] if entry else None
+            
+            entry = self._artifacts.get(path)
+            if entry is None or entry[0] != signature:
+                try:
+                    artifact = self._load(path)
+                except Exception as e:
+                    if entry is None:
+                        raise
+                    print(f"Keeping model version {entry[1]['version']}: {e}")
+                    return entry[1]
+                self._artifacts[path] = (signature, artifact)
+                if entry is not None:
+                    print(f"Model reloaded from {path} (version {artifact['version']})")
+                return artifact
+            return entry[1]
+    
+    def _load(self, path):
+        loaded_model = joblib.load(path, mmap_mode=self.mmap_mode)
+        # Models saved before versioning are identified by their file
+        loaded_model.setdefault("version", f"mtime-{os.path.getmtime(path):.0f}")
+        self.store.verify(path, loaded_model["version"])
+        # Older models recorded categories in arbitrary order; the classifier
+        # knows the real column order of predict_proba
+        pipeline = loaded_model["pipeline"]
+        if hasattr(pipeline, "classes_"):
+            loaded_model["categories"] = pipeline.classes_.tolist()
+        return loaded_model
+    
+    def invalidate(self, path):
+        """Force the next get() to re-check the file"""
+        with self._lock:
+            self._checked_at.pop(path, None)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Get the process-wide model registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, StratifiedKFold
+from .model import PersonaModel
+from .train import preprocess_corpus, transformer_cache
+
+SEARCH_STRATEGIES = ["grid", "halving"]
+
+# Vectorizer settings crossed with each classifier family
+VECTORIZER_GRID = {
+    "tfidf__max_features": [2000, 5000, 20000],
+    "tfidf__ngram_range": [(1, 1), (1, 2)],
+    "tfidf__min_df": [1, 2],
+}
+
+PARAM_GRID = [
+    dict(VECTORIZER_GRID, **{
+        "classifier": [RandomForestClassifier(random_state=42)],
+        "classifier__n_estimators": [100, 300],
+        "classifier__max_depth": [None, 50],
+    }),
+    dict(VECTORIZER_GRID, **{
+        "classifier": [LogisticRegression(max_iter=1000)],
+        "classifier__C": [0.1, 1.0, 10.0],
+    }),
+]
+
+def _describe(params):
+    """Readable, JSON-safe form of a candidate's parameters"""
+    described = {}
+    for name, value in params.items():
+        if name == "classifier":
+            value = type(value).__name__
+        elif isinstance(value, tuple):
+            value = list(value)
+        described[name] = value
+    return described
+
+def build_report(search, n_samples, n_folds, preprocess_seconds, search_seconds):
+    """Summarize every candidate's accuracy, timings and latency
+    
+    Latency is the mean time to score one held-out row. Candidates on the
+    accuracy/latency Pareto front (no other candidate is both more accurate
+    and faster) are flagged. Candidates are listed by accuracy, the faster
+    one first on ties.
+    """
+    results = search.cv_results_
+    # With successive halving, compare the finalists of the last iteration
+    final = results["iter"] == results["iter"].max() if "iter" in results else np.ones(len(results["params"]), bool)
+    
+    candidates = []
+    for i in np.flatnonzero(final):
+        # Successive halving fits on n_resources rows, which can be fewer than n_samples
+        test_rows = (results["n_resources"][i] if "n_resources" in results else n_samples) / n_folds
+        candidates.append({
+            "params": _describe(results["params"][i]),
+            "mean_accuracy": float(results["mean_test_score"][i]),
+            "std_accuracy": float(results["std_test_score"][i]),
+            "fit_seconds": float(results["mean_fit_time"][i]),
+            "latency_ms_per_row": float(results["mean_score_time"][i] / test_rows * 1000),
+        })
+    
+    for candidate in candidates:
+        candidate["pareto"] = not any(
+            other["mean_accuracy"] >= candidate["mean_accuracy"]
+            and other["latency_ms_per_row"] < candidate["latency_ms_per_row"]
+            for other in candidates
+        )
+    candidates.sort(key=lambda candidate: (-candidate["mean_accuracy"], candidate["latency_ms_per_row"]))
+    
+    return {
+        "samples": n_samples,
+        "folds": n_folds,
+        "preprocess_seconds": preprocess_seconds,
+        "search_seconds": search_seconds,
+        "best_params": _describe(search.best_params_),
+        "best_accuracy": float(search.best_score_),
+        "candidates": candidates,
+    }
+
+def print_report(report, top=15):
+    """Print the best candidates of a search report"""
+    print(f"Searched {len(report['candidates'])} candidates on {report['samples']} examples "
+          f"with {report['folds']}-fold CV in {report['search_seconds']:.1f}s "
+          f"(preprocessing once: {report['preprocess_seconds']:.1f}s)")
+    print(f"{'accuracy':>10}{'fit s':>9}{'ms/row':>9}  pareto  params")
+    for candidate in report["candidates"][:top]:
+        print(f"{candidate['mean_accuracy']:>10.3f}{candidate['fit_seconds']:>9.2f}"
+              f"{candidate['latency_ms_per_row']:>9.3f}  {'*' if candidate['pareto'] else ' ':^6}  {candidate['params']}")
+
+def search_model_from_data(texts, labels, strategy="halving", folds=5, n_jobs=-1,
+                           report_path="ml/search_report.json", doc_ids=None, cache_dir=None):
+    """Search vectorizer and classifier settings with stratified k-fold CV
+    
+    The corpus is preprocessed once up front; the folds only slice the
+    cached result; with cache_dir set, it comes from the on-disk corpus
+    cache and fitted TF-IDF matrices are shared between candidates that
+    only differ in classifier settings. Candidates are fitted in parallel
+    worker processes. The
+    best pipeline, refitted on all data, is saved as the served model and a
+    JSON report of every candidate is written to report_path.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}', expected one of {SEARCH_STRATEGIES}")
+    
+    # Every class needs at least one example in each fold
+    smallest_class = min(np.unique(labels, return_counts=True)[1])
+    folds = min(folds, smallest_class)
+    if folds < 2:
+        raise ValueError("Each persona needs at least 2 labeled examples for cross-validation")
+    
+    start = time.perf_counter()
+    processed_texts = preprocess_corpus(texts, doc_ids, cache_dir, n_jobs)
+    preprocess_seconds = time.perf_counter() - start
+    
+    model = PersonaModel()
+    model.create_pipeline(memory=transformer_cache(cache_dir))
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    if strategy == "grid":
+        search = GridSearchCV(model.pipeline, PARAM_GRID, cv=cv, n_jobs=n_jobs, refit=True)
+    else:
+        search = HalvingGridSearchCV(
+            model.pipeline, PARAM_GRID, cv=cv, n_jobs=n_jobs, refit=True, factor=3, random_state=42
+        )
+    
+    start = time.perf_counter()
+    search.fit(processed_texts, labels)
+    search_seconds = time.perf_counter() - start
+    
+    report = build_report(search, len(processed_texts), folds, preprocess_seconds, search_seconds)
+    print_report(report)
+    
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Search report written to {report_path}")
+    
+    classifier = "forest" if isinstance(search.best_estimator_.named_steps["classifier"], RandomForestClassifier) else "linear"
+    search.best_estimator_.set_params(memory=None)
+    model.adopt_pipeline(
+        search.best_estimator_, vectorizer="tfidf", classifier=classifier, stylometric=False
+    )
+    model.save()
+    print(f"Best model (accuracy {report['best_accuracy']:.3f}) saved with {len(model.persona_categories)} categories")
+    return model
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import platform
+from datetime import datetime
+import joblib
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_atomic(path, write):
+    """Write a file next to its destination and rename it into place"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class ModelStore:
+    """Versioned model artifacts with metadata, checksums and rollback
+    
+    Every saved model is kept as <root>/<version>.joblib with a
+    <version>.json metadata file recording its class order, pipeline
+    options, checksum and size. Publishing a version hard-links its file to
+    the served model path (copying where links are unsupported) and renames
+    it into place, so watchers never see a partial file and rolling back is
+    just publishing an older version again.
+    
+    compress=0 keeps artifacts uncompressed so their numpy arrays can be
+    memory-mapped on load; a zlib level (1-9) trades load time for size.
+    prune() keeps the keep newest versions (None keeps every version).
+    """
+    
+    def __init__(self, root="ml/models", compress=0, keep=10):
+        self.root = root
+        self.compress = compress
+        self.keep = keep
+    
+    def artifact_path(self, version):
+        return os.path.join(self.root, f"{version}.joblib")
+    
+    def metadata_path(self, version):
+        return os.path.join(self.root, f"{version}.json")
+    
+    def save(self, artifact, **metadata):
+        """Store an artifact under its version and return its metadata"""
+        import sklearn
+        version = artifact["version"]
+        os.makedirs(self.root, exist_ok=True)
+        path = self.artifact_path(version)
+        _write_atomic(path, lambda tmp: joblib.dump(artifact, tmp, compress=self.compress))
+        
+        metadata = dict(
+            metadata,
+            version=version,
+            created_at=datetime.now().isoformat(timespec="seconds"),
+            classes=list(artifact.get("categories", [])),
+            options=artifact.get("options", {}),
+            checksum=file_checksum(path),
+            size=os.path.getsize(path),
+            compress=self.compress,
+            sklearn_version=sklearn.__version__,
+            python_version=platform.python_version(),
+        )
+        _write_atomic(self.metadata_path(version), lambda tmp: self._write_json(tmp, metadata))
+        return metadata
+    
+    def _write_json(self, path, data):
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+    
+    def metadata(self, version):
+        """Get the metadata of a stored version, or None if it is unknown"""
+        try:
+            with open(self.metadata_path(version)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def versions(self):
+        """Metadata of every stored version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        versions = sorted(name[:-5] for name in os.listdir(self.root) if name.endswith(".json"))
+        return [metadata for metadata in map(self.metadata, versions) if metadata]
+    
+    def verify(self, path, version):
+        """Check a model file against the checksum recorded for its version
+        
+        Files without recorded metadata (models saved before the store
+        existed) are accepted as they are.
+        """
+        metadata = self.metadata(version)
+        if metadata and file_checksum(path) != metadata["checksum"]:
+            raise ValueError(f"Model file {path} does not match the checksum of version {version}")
+    
+    def publish(self, version, path):
+        """Make a stored version the model served from path"""
+        source = self.artifact_path(version)
+        self.verify(source, version)
+        
+        def link(tmp_path):
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+                    for chunk in iter(lambda: src.read(1 << 20), b""):
+                        dst.write(chunk)
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _write_atomic(path, link)
+    
+    def current_version(self, path):
+        """Version of the model served from path, matched by checksum"""
+        if not os.path.exists(path):
+            return None
+        checksum = file_checksum(path)
+        for metadata in reversed(self.versions()):
+            if metadata["checksum"] == checksum:
+                return metadata["version"]
+        return None
+    
+    def rollback(self, path, version=None):
+        """Serve an earlier version from path, by default the one before the current
+        
+        Returns the version now being served.
+        """
+        versions = [metadata["version"] for metadata in self.versions()]
+        if version is None:
+            current = self.current_version(path)
+            if current not in versions or versions.index(current) == 0:
+                raise ValueError("No earlier model version to roll back to")
+            version = versions[versions.index(current) - 1]
+        elif version not in versions:
+            raise ValueError(f"Unknown model version '{version}'")
+        
+        self.publish(version, path)
+        return version
+    
+    def prune(self, path, keep=None):
+        """Delete all but the keep newest stored versions and return the deleted ones
+        
+        The version served from path and the one a rollback would return to
+        are always kept, whatever their age.
+        """
+        keep = self.keep if keep is None else keep
+        versions = [metadata["version"] for metadata in self.versions()]
+        if keep is None or len(versions) <= keep:
+            return []
+        
+        protected = set(versions[len(versions) - keep:]) if keep > 0 else set()
+        current = self.current_version(path)
+        if current in versions:
+            protected.add(current)
+            if versions.index(current) > 0:
+                protected.add(versions[versions.index(current) - 1])
+        
+        deleted = [version for version in versions if version not in protected]
+        for version in deleted:
+            # Metadata last, so a version is never listed without its artifact
+            for file_path in (self.artifact_path(version), self.metadata_path(version)):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+        return deleted
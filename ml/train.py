@@ -1,22 +1,55 @@
-import pandas as pd
+import os
+import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
+from .corpus_cache import CorpusCache
+from .features import FEATURES_VERSION
 from .model import PersonaModel
-from .preprocess import TextPreprocessor
+from .preprocess import FastTextPreprocessor, PREPROCESSOR_VERSION
 
-def train_model_from_data(texts, labels):
-    """Train a persona model from text data and labels"""
-    # Preprocess texts
-    preprocessor = TextPreprocessor()
-    processed_texts = [preprocessor.preprocess(text) for text in texts]
+def preprocess_corpus(texts, doc_ids=None, cache_dir=None, n_jobs=-1):
+    """Preprocess a training corpus, through the on-disk cache when cache_dir is set"""
+    if cache_dir:
+        return CorpusCache(cache_dir).preprocess(texts, doc_ids, n_jobs=n_jobs)
+    return FastTextPreprocessor().preprocess_many(texts, n_jobs=n_jobs)
+
+def transformer_cache(cache_dir):
+    """Directory for cached fitted transformers (TF-IDF matrices) under a cache dir
+    
+    The cache is keyed by the raw input texts, so it is kept per version of
+    the preprocessing and feature code that turns them into features.
+    """
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, "transformers", f"preprocess-{PREPROCESSOR_VERSION}-features-{FEATURES_VERSION}")
+
+def train_model_from_data(texts, labels, n_jobs=-1, vectorizer="tfidf", classifier="forest", stylometric=False,
+                          doc_ids=None, cache_dir=None):
+    """Train a persona model from text data and labels
+    
+    vectorizer, classifier and stylometric select the pipeline variant; see
+    PersonaModel.create_pipeline. With cache_dir set, only documents that are
+    new or changed since the last run are preprocessed, and the fitted
+    TF-IDF matrix is reused when the training corpus is unchanged.
+    """
+    model = PersonaModel()
+    model.create_pipeline(
+        vectorizer=vectorizer, classifier=classifier, stylometric=stylometric,
+        memory=transformer_cache(cache_dir)
+    )
+    
+    # Preprocess texts, unless the pipeline needs the raw text itself
+    if model.expects_raw_text:
+        processed_texts = list(texts)
+    else:
+        processed_texts = preprocess_corpus(texts, doc_ids, cache_dir, n_jobs)
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(
         processed_texts, labels, test_size=0.2, random_state=42
     )
     
-    # Create and train model
-    model = PersonaModel()
+    # Train model
     model.train(X_train, y_train)
     
     # Evaluate model
@@ -27,3 +60,67 @@ def train_model_from_data(texts, labels):
         print(report)
     
     return model
+
+def train_model_streaming(batches, classes, checkpoint_path="ml/persona_model.checkpoint.joblib",
+                          checkpoint_every=10, resume=False, n_jobs=1):
+    """Train a persona model out of core from an iterable of (text, label) batches
+    
+    Memory stays constant: each batch is preprocessed, hashed and folded into
+    an SGD classifier with partial_fit, then discarded. Every batch after the
+    first is scored before it is learned from, giving a running held-out
+    accuracy without a separate test set. A checkpoint recording how many
+    documents have been consumed is written every checkpoint_every batches;
+    with resume=True training continues from it, and the caller is expected
+    to skip that many documents (see resume_offset).
+    """
+    preprocessor = FastTextPreprocessor()
+    model = PersonaModel()
+    documents = 0
+    batch_count = 0
+    
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = model.load_checkpoint(checkpoint_path)
+        documents = checkpoint.get("documents", 0)
+        batch_count = checkpoint.get("batches", 0)
+        print(f"Resuming from checkpoint after {documents} documents")
+    else:
+        model.create_streaming_pipeline()
+    
+    correct = scored = 0
+    for batch in batches:
+        texts = preprocessor.preprocess_many([text for text, _ in batch], n_jobs=n_jobs)
+        labels = [label for _, label in batch]
+        
+        if batch_count:
+            predictions = model.pipeline.predict(texts)
+            correct += sum(p == y for p, y in zip(predictions, labels))
+            scored += len(labels)
+        
+        model.partial_fit(texts, labels, classes)
+        documents += len(batch)
+        batch_count += 1
+        
+        if batch_count % checkpoint_every == 0:
+            model.save(checkpoint_path, documents=documents, batches=batch_count)
+            accuracy = f", running accuracy {correct / scored:.3f}" if scored else ""
+            print(f"Checkpoint after {documents} documents{accuracy}")
+    
+    if not documents:
+        print("No labeled data to train on")
+        return None
+    
+    model.save()
+    if scored:
+        print(f"Progressive validation accuracy: {correct / scored:.3f} over {scored} documents")
+    print(f"Model trained on {documents} documents and saved with {len(classes)} categories")
+    
+    # The final model supersedes the checkpoint
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return model
+
+def resume_offset(checkpoint_path="ml/persona_model.checkpoint.joblib"):
+    """Number of documents a checkpoint has already consumed"""
+    if not os.path.exists(checkpoint_path):
+        return 0
+    return joblib.load(checkpoint_path).get("documents", 0)
@@ -0,0 +1,45 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.base import BaseEstimator, TransformerMixin
+from .features import FeatureExtractor, FEATURE_COLUMNS
+from .preprocess import FastTextPreprocessor
+
+# scikit-learn pipeline steps live here rather than next to the code they
+# wrap, so importing ml.preprocess or ml.features does not import sklearn.
+# Both modules still resolve these names for models pickled before the move.
+
+class PreprocessTransformer(BaseEstimator, TransformerMixin):
+    """Pipeline step that applies FastTextPreprocessor to raw text"""
+    
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X):
+        if not hasattr(self, "_preprocessor"):
+            self._preprocessor = FastTextPreprocessor()
+        return [self._preprocessor.preprocess(text) for text in X]
+    
+    def __getstate__(self):
+        # The preprocessor holds an lru_cache and is rebuilt after unpickling
+        state = self.__dict__.copy()
+        state.pop("_preprocessor", None)
+        return state
+
+class StylometricTransformer(BaseEstimator, TransformerMixin):
+    """Pipeline step that turns raw texts into a float32 CSR feature matrix
+    
+    Unbounded counts (text length, word count) are log-scaled so that a
+    following MaxAbsScaler keeps every column in a comparable range.
+    """
+    
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X):
+        features = FeatureExtractor().extract_features_batch(X)
+        for column in ['text_length', 'word_count']:
+            features[column] = np.log1p(features[column])
+        return csr_matrix(features.to_numpy(dtype=np.float32))
+    
+    def get_feature_names_out(self, input_features=None):
+        return np.array(FEATURE_COLUMNS, dtype=object)
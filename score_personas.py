@@ -0,0 +1,37 @@
+import argparse
+from database.mongodb import MongoDB
+from services.persona_service import PersonaService
+from utils.config import load_env_file
+
+def load_session_ids(path):
+    """Load session ids from a file with one id per line"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score persona predictions for many sessions")
+    parser.add_argument("--sessions", type=str, help="File with one session id per line (default: all sessions)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Sessions read and scored per chunk")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cores to use (-1 for all)")
+    
+    args = parser.parse_args()
+    
+    # Load configuration and connect to MongoDB
+    load_env_file()
+    db = MongoDB()
+    
+    persona_service = PersonaService()
+    if not persona_service.use_custom_model:
+        print("No trained model found; train one with train_persona_model.py first")
+        return
+    
+    session_ids = load_session_ids(args.sessions) if args.sessions else db.get_all_session_ids()
+    print(f"Scoring {len(session_ids)} sessions")
+    
+    scored = persona_service.analyze_many(
+        session_ids, db, chunk_size=args.chunk_size, n_jobs=args.n_jobs
+    )
+    print(f"Persona scoring completed: {scored} sessions written")
+
+if __name__ == "__main__":
+    main()
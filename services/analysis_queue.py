@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+class AnalysisQueue:
+    """Runs persona analyses on a bounded worker pool instead of the request thread
+    
+    Jobs are recorded in MongoDB with their status and, once finished, their
+    result or error, so a later rerun of the page (or another replica) can
+    poll for them. A session has at most one job in flight: submitting again
+    while one is queued or running returns the existing job. A unique
+    index over the active jobs enforces that across replicas. At most
+    max_workers analyses run at once; the rest wait in the queue.
+    
+    The process holding a job renews a heartbeat on it every
+    stale_after / 4 seconds, queued or running. A job whose heartbeat is
+    older than stale_after seconds belongs to a process that stopped; it is
+    marked failed and no longer blocks a new submission.
+    """
+    
+    def __init__(self, persona_service, db, max_workers=2, stale_after=600):
+        self.persona_service = persona_service
+        self.db = db
+        self.stale_after = timedelta(seconds=stale_after)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="persona-analysis")
+        # session_id -> _id of the job this process is running for it
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(
+            target=self._renew_leases, args=(stale_after / 4,), name="persona-analysis-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+    
+    def submit(self, session_id):
+        """Queue an analysis of a session and return its job id"""
+        latest = self.latest(session_id)
+        if latest is not None and latest["status"] in ACTIVE:
+            return latest["_id"]
+        
+        with self._lock:
+            if session_id in self._inflight:
+                return self._inflight[session_id]
+            job_id = self._inflight[session_id] = ObjectId()
+        
+        now = datetime.now()
+        try:
+            self.db.save_analysis_job({
+                "_id": job_id,
+                "session_id": session_id,
+                "status": QUEUED,
+                "active": True,
+                "created_at": now,
+                "heartbeat_at": now,
+            })
+        except DuplicateKeyError:
+            # Another replica queued one first
+            with self._lock:
+                self._inflight.pop(session_id, None)
+            latest = self.db.get_latest_analysis_job(session_id)
+            return latest["_id"] if latest is not None else None
+        except Exception:
+            with self._lock:
+                self._inflight.pop(session_id, None)
+            raise
+        
+        try:
+            self.executor.submit(self._run, session_id, job_id)
+        except Exception as e:
+            self._finish(session_id, job_id, {"status": FAILED, "error": str(e)})
+            raise
+        return job_id
+    
+    def latest(self, session_id):
+        """Get the latest job of a session, marking it failed if its process stopped"""
+        job = self.db.get_latest_analysis_job(session_id)
+        if job is None or job["status"] not in ACTIVE:
+            return job
+        
+        with self._lock:
+            running_here = self._inflight.get(session_id) == job["_id"]
+        heartbeat = job.get("heartbeat_at", job["created_at"])
+        if not running_here and datetime.now() - heartbeat > self.stale_after:
+            fields = {"error": "The analysis was interrupted before it finished"}
+            # Only if the heartbeat is still the one seen, so a live holder wins
+            self.db.fail_stale_analysis_job(job["_id"], heartbeat, fields)
+            job.update(status=FAILED, active=False, **fields)
+        return job
+    
+    def _renew_leases(self, interval):
+        while not self._stopped.wait(interval):
+            with self._lock:
+                job_ids = list(self._inflight.values())
+            if not job_ids:
+                continue
+            try:
+                self.db.touch_analysis_jobs(job_ids)
+            except Exception as e:
+                print(f"Error renewing analysis job heartbeats: {e}")
+    
+    def _run(self, session_id, job_id):
+        try:
+            self.db.update_analysis_job(job_id, {"status": RUNNING, "started_at": datetime.now()})
+            result = self.persona_service.analyze_session(session_id, self.db)
+            self._finish(session_id, job_id, {"status": DONE, "result": result})
+        except Exception as e:
+            print(f"Error analyzing session {session_id}: {e}")
+            self._finish(session_id, job_id, {"status": FAILED, "error": str(e)})
+    
+    def _finish(self, session_id, job_id, fields):
+        """Record the outcome of a job and release its session"""
+        try:
+            self.db.update_analysis_job(job_id, {**fields, "active": False, "finished_at": datetime.now()})
+        except Exception as e:
+            print(f"Error recording analysis {job_id}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(session_id, None)
+    
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and, by default, wait for running ones"""
+        self.executor.shutdown(wait=wait)
+        self._stopped.set()
@@ -1,35 +1,87 @@
-import openai
-import streamlit as st
+import time
+from collections import deque
+import numpy as np
+from utils.config import config
+from utils.metrics import timed
+from .context_window import ContextWindow
+from .llm import LLMClient, get_llm
 
 class ChatService:
-    def __init__(self):
-        openai.api_key = st.secrets["openai_api_key"]
+    def __init__(self, client=None, context_window=None, llm=None):
+        # Anything with the OpenAI client interface works, e.g. FakeOpenAIClient;
+        # without one, requests go through the process-wide LLMClient
+        self._llm = llm or (LLMClient(client=client) if client is not None else None)
+        self.context_window = context_window or ContextWindow(
+            token_budget=int(config.get("chat_context_tokens", 3000)),
+            summary_tokens=int(config.get("chat_summary_tokens", 300)),
+            max_sessions=int(config.get("chat_summary_sessions", 10000))
+        )
+        # Timings of recent streamed responses, newest last
+        self.stream_metrics = deque(maxlen=1000)
+    
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = get_llm()
+        return self._llm
     
-    def get_bot_response(self, user_message, chat_history):
-        """Get a response from the OpenAI API based on user input and chat history"""
-        messages = []
+    @timed("chat.get_bot_response")
+    def get_bot_response(self, user_message, chat_history, session_id=None, load_earlier=None):
+        """Get a response from the OpenAI API based on user input and chat history
         
-        # Convert chat history to the format expected by OpenAI
-        for msg in chat_history:
-            if "user_message" in msg:
-                messages.append({"role": "user", "content": msg["user_message"]})
-            if "bot_message" in msg:
-                messages.append({"role": "assistant", "content": msg["bot_message"]})
+        chat_history may be only the latest exchanges if load_earlier is
+        given; see ContextWindow.
+        """
+        # Keep the most recent history that fits the token budget, with a
+        # rolling summary of anything older
+        messages = self.context_window.build_messages(user_message, chat_history, session_id, load_earlier)
         
-        # Add the current user message
-        messages.append({"role": "user", "content": user_message})
+        # Call the OpenAI API
+        return self.llm.complete(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=500
+        )
+    
+    @timed("chat.stream_bot_response")
+    def stream_bot_response(self, user_message, chat_history, session_id=None, load_earlier=None):
+        """Yield the response text as it arrives from the OpenAI API
         
-        # Add system message to guide the assistant's behavior
-        messages.insert(0, {
-            "role": "system", 
-            "content": "You are a helpful assistant. Be concise and friendly in your responses."
-        })
+        Time to first token and total time are recorded in stream_metrics
+        once the stream completes.
+        """
+        messages = self.context_window.build_messages(user_message, chat_history, session_id, load_earlier)
         
-        # Call the OpenAI API
-        response = openai.chat.completions.create(
+        started = time.perf_counter()
+        first_token_at = None
+        chunks = 0
+        stream = self.llm.stream(
             model="gpt-3.5-turbo",
             messages=messages,
             max_tokens=500
         )
         
-        return response.choices[0].message.content
\ No newline at end of file
+        for content in stream:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            yield content
+        
+        finished = time.perf_counter()
+        self.stream_metrics.append({
+            "time_to_first_token": (first_token_at or finished) - started,
+            "total_seconds": finished - started,
+            "chunks": chunks,
+        })
+    
+    def stream_stats(self):
+        """Summarize time to first token and total latency of recent streams"""
+        if not self.stream_metrics:
+            return {}
+        
+        stats = {"responses": len(self.stream_metrics)}
+        for name in ["time_to_first_token", "total_seconds"]:
+            values = np.array([metric[name] for metric in self.stream_metrics])
+            stats[f"{name}_p50"] = float(np.percentile(values, 50))
+            stats[f"{name}_p99"] = float(np.percentile(values, 99))
+        return stats
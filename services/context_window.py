@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+# Tokens the chat format adds around each message's content
+MESSAGE_OVERHEAD = 4
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant. Be concise and friendly in your responses."
+
+# Precedes the rolling summary in its system message
+SUMMARY_HEADER = "Summary of earlier user messages in this conversation:\n"
+
+@lru_cache(maxsize=None)
+def _encoding():
+    """The cl100k_base tokenizer, or None if tiktoken or its data is unavailable
+    
+    Loaded on first use: tiktoken downloads the encoding the first time it is
+    used on a machine, which must not happen at import time.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken unavailable ({e!r}); estimating prompt tokens as characters / 4")
+        return None
+
+@lru_cache(maxsize=20000)
+def count_tokens(text):
+    """Count (or, without tiktoken, estimate) the tokens in a message's content
+    
+    Counts are memoized by text, so each stored message is only measured once
+    no matter how many turns it stays in the window.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def summarize_turns(previous_summary, turns, max_tokens):
+    """Fold turns that left the window into an extractive rolling summary
+    
+    Keeps the opening of each user message; when the summary outgrows
+    max_tokens the oldest snippets are dropped first.
+    """
+    snippets = previous_summary.split("\n") if previous_summary else []
+    for turn in turns:
+        user_message = " ".join(turn.get("user_message", "").split())
+        if user_message:
+            snippets.append(f"- {user_message[:200]}")
+    
+    while snippets and count_tokens("\n".join(snippets)) > max_tokens:
+        snippets.pop(0)
+    return "\n".join(snippets)
+
+def _turn_key(turn):
+    """Position of a stored exchange in its session's history, or None if it has none"""
+    if "timestamp" not in turn or "_id" not in turn:
+        return None
+    return turn["timestamp"], turn["_id"]
+
+class ContextWindow:
+    """Builds OpenAI chat messages for a turn under a token budget
+    
+    The most recent exchanges are kept verbatim, newest first, until the
+    budget runs out. Older exchanges are folded into a rolling summary that
+    is cached per session, keyed by the last exchange it covers, and only
+    extended with exchanges after that one. The cache keeps the
+    max_sessions most recently used sessions.
+    
+    The history passed in may be just the latest exchanges of a session.
+    Pass load_earlier(first_turn, limit) to fetch up to limit exchanges
+    before first_turn; it is called when the cached summary may not reach
+    the start of the history, e.g. on a session's first turn in this
+    process.
+    """
+    
+    def __init__(self, token_budget=3000, summary_tokens=300, system_prompt=DEFAULT_SYSTEM_PROMPT,
+                 summarizer=summarize_turns, max_sessions=10000):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.system_prompt = system_prompt
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+        # session_id -> (key of the last exchange summarized, summary text), least recently used first
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _turn_messages(self, turn):
+        messages = []
+        if "user_message" in turn:
+            messages.append({"role": "user", "content": turn["user_message"]})
+        if "bot_message" in turn:
+            messages.append({"role": "assistant", "content": turn["bot_message"]})
+        return messages
+    
+    def _message_tokens(self, message):
+        return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+    
+    def _summary(self, session_id, chat_history, first_kept, load_earlier=None):
+        """Get the rolling summary of everything before chat_history[first_kept]"""
+        older_turns = chat_history[:first_kept]
+        if not older_turns and load_earlier is None:
+            return ""
+        
+        cached = None
+        if session_id is not None:
+            with self._lock:
+                cached = self._summaries.get(session_id)
+                if cached is not None:
+                    self._summaries.move_to_end(session_id)
+        
+        earlier = []
+        start_key = _turn_key(chat_history[0]) if chat_history else None
+        if load_earlier is not None and start_key is not None and (cached is None or cached[0] < start_key):
+            # The summary never keeps more than summary_tokens snippets, so
+            # that many earlier exchanges are enough to rebuild it
+            earlier = load_earlier(chat_history[0], self.summary_tokens)
+        
+        turns = earlier + older_turns
+        keys = [_turn_key(turn) for turn in turns]
+        if None in keys:
+            # Exchanges that were never stored cannot be tracked; summarize afresh
+            return self.summarizer("", turns, self.summary_tokens)
+        
+        last_key, summary = cached if cached is not None else (None, "")
+        new_turns = [turn for turn, key in zip(turns, keys) if last_key is None or key > last_key]
+        if not new_turns:
+            return summary
+        
+        summary = self.summarizer(summary, new_turns, self.summary_tokens)
+        if session_id is not None:
+            with self._lock:
+                self._summaries[session_id] = (_turn_key(new_turns[-1]), summary)
+                self._summaries.move_to_end(session_id)
+                while len(self._summaries) > self.max_sessions:
+                    self._summaries.popitem(last=False)
+        return summary
+    
+    def build_messages(self, user_message, chat_history, session_id=None, load_earlier=None):
+        """Build the messages list for a new user message and prior exchanges, oldest first"""
+        system_message = {"role": "system", "content": self.system_prompt}
+        current_message = {"role": "user", "content": user_message}
+        
+        remaining = self.token_budget - self._message_tokens(system_message) - self._message_tokens(current_message)
+        if chat_history:
+            # Reserve room for the summary message in case older turns get dropped
+            remaining -= count_tokens(SUMMARY_HEADER) + self.summary_tokens + MESSAGE_OVERHEAD
+        
+        # Walk back from the newest exchange, keeping whole turns that fit
+        kept = []
+        first_kept = len(chat_history)
+        for index in range(len(chat_history) - 1, -1, -1):
+            turn_messages = self._turn_messages(chat_history[index])
+            cost = sum(self._message_tokens(message) for message in turn_messages)
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept.append(turn_messages)
+            first_kept = index
+        
+        messages = [system_message]
+        summary = self._summary(session_id, chat_history, first_kept, load_earlier)
+        if summary:
+            messages.append({"role": "system", "content": SUMMARY_HEADER + summary})
+        for turn_messages in reversed(kept):
+            messages.extend(turn_messages)
+        messages.append(current_message)
+        return messages
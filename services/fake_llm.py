@@ -0,0 +1,202 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+class FakeCompletions:
+    """Stand-in for client.chat.completions that answers locally
+    
+    latency is the wait before the response (or, when streaming, before the
+    first chunk); token_latency is the wait between streamed chunks.
+    """
+    
+    def __init__(self, latency=0.0, reply=None, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.reply = reply or (lambda messages: f"You said: {messages[-1]['content']}")
+        self.requests = []
+    
+    def create(self, model, messages, stream=False, **kwargs):
+        self.requests.append({"model": model, "messages": messages, "stream": stream, **kwargs})
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return self._stream(model, self.reply(messages))
+        message = SimpleNamespace(role="assistant", content=self.reply(messages))
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+        )
+    
+    def _stream(self, model, content):
+        """Yield the reply word by word as chat.completion.chunk objects"""
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            delta = SimpleNamespace(role="assistant" if i == 0 else None, content=word if i == 0 else f" {word}")
+            yield SimpleNamespace(
+                model=model,
+                choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)],
+            )
+        yield SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, delta=SimpleNamespace(role=None, content=None), finish_reason="stop")],
+        )
+
+class FakeOpenAIClient:
+    """Offline drop-in for the parts of the OpenAI client the services use
+    
+    Every request is recorded in `chat.completions.requests` so callers can
+    check the prompts that would have been sent.
+    """
+    
+    def __init__(self, latency=0.0, reply=None, token_latency=0.0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, reply, token_latency))
+
+class _FakeChatHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse their connections as with the real API
+    protocol_version = "HTTP/1.1"
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+        
+        server = self.server
+        rejection = server.admit()
+        if rejection:
+            status, message, headers = rejection
+            return self._send_json(status, {"error": {"message": message, "type": "fake_error"}}, headers)
+        
+        if server.latency:
+            time.sleep(server.latency)
+        model = body.get("model", "fake")
+        content = server.reply(body.get("messages", []))
+        if body.get("stream"):
+            self._send_stream(model, content)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())},
+            })
+    
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _send_stream(self, model, content):
+        """Send the reply word by word as server-sent chat.completion.chunk events"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = content.split(" ")
+        for i, word in enumerate(words + [None]):
+            if i and self.server.token_latency:
+                time.sleep(self.server.token_latency)
+            delta = {} if word is None else {"role": "assistant", "content": word} if i == 0 else {"content": f" {word}"}
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": "stop" if word is None else None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+    
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+    
+    def log_message(self, format, *args):
+        pass
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Local HTTP server speaking the OpenAI chat completions API
+    
+    Point the OpenAI SDK (or LLMClient, via openai_base_url) at
+    `server.base_url` to exercise connection pooling, concurrency, rate
+    limiting and retries offline. Requests beyond rate_limit per second get
+    a 429 with Retry-After, like the real API; failure_rate is the share of
+    other requests answered with a 500. `requests` counts what was
+    received and `rejected` what was refused.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_latency=0.0, reply=None,
+                 rate_limit=0, failure_rate=0.0, seed=0):
+        super().__init__((host, port), _FakeChatHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.reply = reply or (lambda messages: f"You said: {messages[-1]['content']}" if messages else "Hello")
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+    
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def admit(self):
+        """Count a request and return (status, message, headers) if it is refused"""
+        with self._lock:
+            self.requests += 1
+            second = int(time.monotonic())
+            window, count = self._window
+            count = count + 1 if window == second else 1
+            self._window = (second, count)
+            if self.rate_limit and count > self.rate_limit:
+                self.rejected += 1
+                return 429, "Rate limit reached", {"Retry-After": "1"}
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                self.rejected += 1
+                return 500, "The server had an error while processing your request", {}
+        return None
+    
+    def start(self):
+        """Serve from a background thread and return self"""
+        threading.Thread(target=self.serve_forever, name="fake-llm-server", daemon=True).start()
+        return self
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Wait before each response or first chunk")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Wait between streamed chunks")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests per second before answering 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    
+    args = parser.parse_args()
+    server = FakeLLMServer(args.host, args.port, args.latency, args.token_latency,
+                           rate_limit=args.rate_limit, failure_rate=args.failure_rate)
+    print(f"Fake OpenAI API at {server.base_url}; set OPENAI_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
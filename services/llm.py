@@ -0,0 +1,316 @@
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from utils.config import config
+from utils.metrics import timed
+
+# HTTP statuses worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRY_STATUSES = {408, 409, 429}
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out waits instead of blocking
+    
+    reserve() takes tokens immediately, letting the balance go negative,
+    and returns how long the caller must wait before using them, so the
+    same bucket paces threads (time.sleep) and coroutines (asyncio.sleep)
+    alike. A rate of 0 disables the limit.
+    """
+    
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+    
+    def reserve(self, tokens=1):
+        """Take tokens and return the seconds to wait before they are available"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A request bigger than the bucket waits for a full bucket rather than forever
+            self.tokens -= min(tokens, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+def is_retryable(error):
+    """Whether an OpenAI SDK error is transient: a connection problem, timeout, rate limit or 5xx"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    # APIConnectionError and its APITimeoutError subclass carry no status
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from a Retry-After header, or None"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _request_key(model, messages, kwargs):
+    return json.dumps([model, messages, kwargs], sort_keys=True, default=str)
+
+class _AsyncState:
+    """Per-event-loop async client, concurrency limit and in-flight requests"""
+    
+    def __init__(self, client, max_concurrency):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.inflight = {}
+
+class LLMClient:
+    """Shared chat-completion client with rate limiting, retries and coalescing
+    
+    One instance is meant to serve the whole process (see get_llm). It
+    keeps a single OpenAI client, and so a single pool of keep-alive HTTP
+    connections, instead of configuring the SDK module globally. Every
+    request:
+    
+    - waits for a slot among max_concurrency concurrent requests, so bursts
+      queue here instead of piling up threads on the API;
+    - is paced by token buckets of requests_per_second (allowing bursts of
+      burst requests, a tenth of a second's worth by default) and, if set,
+      tokens_per_minute (estimated as prompt characters / 4 plus max_tokens,
+      the way the API counts them);
+    - is retried up to max_retries times on transient errors, with full
+      jitter exponential backoff or the server's Retry-After, capped at
+      max_backoff.
+    
+    With coalesce=True, identical requests already in flight share one API
+    call and its response. Streams are only retried before the first chunk.
+    
+    client may be anything with the OpenAI client interface, e.g.
+    FakeOpenAIClient, and async_client anything with the AsyncOpenAI one;
+    otherwise the SDK is imported on the first request and pointed at
+    base_url if one is given.
+    """
+    
+    def __init__(self, client=None, async_client=None, api_key=None, base_url=None, timeout=60.0,
+                 max_retries=4, backoff=0.5, max_backoff=20.0, max_concurrency=16,
+                 requests_per_second=0, burst=None, tokens_per_minute=0):
+        self._client = client
+        self._async_client = async_client
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        # A full second of burst on top of the steady rate would overshoot a per-second limit
+        burst = burst if burst is not None else max(1, requests_per_second / 10)
+        self.request_bucket = TokenBucket(requests_per_second, capacity=burst)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._async_states = weakref.WeakKeyDictionary()
+        self.counts = {"requests": 0, "retries": 0, "coalesced": 0, "failures": 0}
+        self.throttled_seconds = 0.0
+    
+    def _sdk_options(self):
+        return {
+            "api_key": self.api_key if self.api_key is not None else config["openai_api_key"],
+            "base_url": self.base_url,
+            "timeout": self.timeout,
+            # Retries happen here, under the rate limits
+            "max_retries": 0,
+        }
+    
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import openai
+                    self._client = openai.OpenAI(**self._sdk_options())
+        return self._client
+    
+    def _async_state(self):
+        # asyncio primitives and the async HTTP pool belong to one event loop
+        loop = asyncio.get_running_loop()
+        state = self._async_states.get(loop)
+        if state is None:
+            client = self._async_client
+            if client is None:
+                import openai
+                client = openai.AsyncOpenAI(**self._sdk_options())
+            state = self._async_states[loop] = _AsyncState(client, self.max_concurrency)
+        return state
+    
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+    
+    def _throttle_wait(self, messages, kwargs):
+        """Reserve rate-limit tokens for a request and return the wait"""
+        wait = self.request_bucket.reserve()
+        if self.token_bucket.rate > 0:
+            prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+            wait = max(wait, self.token_bucket.reserve(prompt_chars / 4 + kwargs.get("max_tokens", 0)))
+        if wait:
+            with self._lock:
+                self.throttled_seconds += wait
+        return wait
+    
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying, or None to give up"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        self._count("retries")
+        delay = retry_after(error)
+        if delay is None:
+            return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        # A server asking for minutes should not hold a request thread that long
+        return min(delay, self.max_backoff)
+    
+    def _create(self, model, messages, **kwargs):
+        """One rate-limited, retried call to the API"""
+        attempt = 0
+        with self._slots:
+            while True:
+                wait = self._throttle_wait(messages, kwargs)
+                if wait:
+                    time.sleep(wait)
+                self._count("requests")
+                try:
+                    return self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        self._count("failures")
+                        raise
+                attempt += 1
+                time.sleep(delay)
+    
+    @timed("llm.complete")
+    def complete(self, model, messages, coalesce=False, **kwargs):
+        """Get the reply text of a chat completion"""
+        if not coalesce:
+            return self._create(model, messages, **kwargs).choices[0].message.content
+        
+        key = _request_key(model, messages, kwargs)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._count("coalesced")
+            return future.result()
+        
+        try:
+            future.set_result(self._create(model, messages, **kwargs).choices[0].message.content)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return future.result()
+    
+    @timed("llm.stream")
+    def stream(self, model, messages, **kwargs):
+        """Yield the reply text of a streamed chat completion as it arrives
+        
+        The concurrency slot is held until the stream is consumed or closed.
+        """
+        attempt = 0
+        with self._slots:
+            while True:
+                wait = self._throttle_wait(messages, kwargs)
+                if wait:
+                    time.sleep(wait)
+                self._count("requests")
+                try:
+                    chunks = iter(self.client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **kwargs
+                    ))
+                    # Errors surface on the first chunk, while a retry cannot yet repeat any text
+                    first = next(chunks, None)
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        self._count("failures")
+                        raise
+                attempt += 1
+                time.sleep(delay)
+            
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    async def _acreate(self, state, model, messages, **kwargs):
+        attempt = 0
+        async with state.semaphore:
+            while True:
+                wait = self._throttle_wait(messages, kwargs)
+                if wait:
+                    await asyncio.sleep(wait)
+                self._count("requests")
+                try:
+                    return await state.client.chat.completions.create(model=model, messages=messages, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        self._count("failures")
+                        raise
+                attempt += 1
+                await asyncio.sleep(delay)
+    
+    @timed("llm.acomplete")
+    async def acomplete(self, model, messages, coalesce=False, **kwargs):
+        """Async complete(): get the reply text of a chat completion without blocking the loop"""
+        state = self._async_state()
+        if not coalesce:
+            return (await self._acreate(state, model, messages, **kwargs)).choices[0].message.content
+        
+        key = _request_key(model, messages, kwargs)
+        task = state.inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+        else:
+            task = state.inflight[key] = asyncio.ensure_future(self._acreate(state, model, messages, **kwargs))
+            task.add_done_callback(lambda _: state.inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the shared request
+        return (await asyncio.shield(task)).choices[0].message.content
+    
+    def stats(self):
+        """Request, retry, coalescing and failure counts, and total seconds spent throttled"""
+        with self._lock:
+            return {**self.counts, "throttled_seconds": round(self.throttled_seconds, 3)}
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Get the process-wide LLMClient, configured from settings
+    
+    openai_base_url points it at another endpoint, such as the fake server
+    in services.fake_llm. llm_max_concurrency, llm_requests_per_second,
+    llm_burst, llm_tokens_per_minute, llm_max_retries and llm_timeout tune
+    it.
+    """
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = LLMClient(
+                base_url=config.get("openai_base_url"),
+                timeout=float(config.get("llm_timeout", 60)),
+                max_retries=int(config.get("llm_max_retries", 4)),
+                max_concurrency=int(config.get("llm_max_concurrency", 16)),
+                requests_per_second=float(config.get("llm_requests_per_second", 0)),
+                burst=float(config["llm_burst"]) if config.get("llm_burst") else None,
+                tokens_per_minute=float(config.get("llm_tokens_per_minute", 0)),
+            )
+        return _llm
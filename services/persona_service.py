@@ -1,18 +1,64 @@
-import openai
-import streamlit as st
+from datetime import datetime
+from ml.cache import PredictionCache
 from ml.model import PersonaModel
-from ml.preprocess import TextPreprocessor
+from ml.preprocess import FastTextPreprocessor
+from ml.profile import ProfileBuilder
+from utils.config import config
+from utils.metrics import timed
+from .llm import get_llm
+
+MIN_MESSAGES = 3
 
 class PersonaService:
-    def __init__(self):
-        openai.api_key = st.secrets["openai_api_key"]
-        self.model = PersonaModel()
-        self.preprocessor = TextPreprocessor()
-        self.use_custom_model = self.model.load_model()  # Check if model exists
+    def __init__(self, db=None):
+        # Share cached predictions across replicas through MongoDB when available
+        self.cache = PredictionCache(
+            max_size=int(config.get("prediction_cache_size", 10000)),
+            ttl=float(config.get("prediction_cache_ttl", 3600)),
+            collection=db.prediction_cache_collection if db else None
+        )
+        self.model = PersonaModel(cache=self.cache)
+        self.preprocessor = FastTextPreprocessor()
+        self.model.load_model()  # Load the shared model now rather than on the first analysis
+        self.profile_builder = ProfileBuilder(self.preprocessor, self.model.build_analyzer())
+    
+    @property
+    def use_custom_model(self):
+        """Whether a trained custom model is available (it may appear or change while running)"""
+        return self.model.pipeline is not None
+    
+    def profile_update(self, user_message):
+        """Build the incremental profile update for a newly sent message"""
+        return self.profile_builder.message_update(user_message)
+    
+    @timed("persona.analyze_profile")
+    def analyze_profile(self, profile):
+        """Analyze a session from its running profile without reading its history
+        
+        Returns None when the profile cannot be scored by the custom model, in
+        which case callers should fall back to analyze_user_persona.
+        """
+        if not profile:
+            return None
+        if profile.get("message_count", 0) < MIN_MESSAGES:
+            return "Not enough data to analyze persona yet. Please continue chatting."
+        if not self.use_custom_model or self.model.build_analyzer() is None:
+            return None
+        
+        try:
+            proba, predicted, classes = self.model.predict_batch_from_counts([profile.get("term_counts", {})])
+        except Exception as e:
+            print(f"Error scoring persona profile: {e}")
+            return None
+        
+        result = self._format_result(classes, proba[0], predicted[0])
+        result += self._format_style(self.profile_builder.profile_features(profile))
+        return result
     
+    @timed("persona.analyze_user_persona")
     def analyze_user_persona(self, messages):
         """Analyze user messages to determine their persona"""
-        if not messages or len(messages) < 3:
+        if not messages or len(messages) < MIN_MESSAGES:
             return "Not enough data to analyze persona yet. Please continue chatting."
         
         # Combine all user messages for analysis
@@ -22,22 +68,11 @@ class PersonaService:
         if self.use_custom_model:
             try:
                 # Preprocess the text
-                processed_text = self.preprocessor.preprocess(user_text)
-                
-                # Get prediction and probabilities
-                predicted_persona = self.model.predict(processed_text)
-                probabilities = self.model.predict_proba(processed_text)
-                
-                # Format the result
-                result = f"### User Persona: {predicted_persona}\n\n"
-                result += "#### Persona Confidence Scores:\n"
+                processed_text = self._model_input(user_text)
                 
-                # Sort probabilities by confidence
-                sorted_probs = sorted(probabilities.items(), key=lambda x: x[1], reverse=True)
-                for persona, prob in sorted_probs:
-                    result += f"- {persona}: {prob:.2%}\n"
-                
-                return result
+                # Get prediction and probabilities from a single pass
+                proba, predicted, classes = self.model.predict_batch([processed_text])
+                return self._format_result(classes, proba[0], predicted[0])
             except Exception as e:
                 # Fall back to OpenAI if there's an error with custom model
                 print(f"Error using custom model: {e}")
@@ -46,6 +81,123 @@ class PersonaService:
             # Use OpenAI's API if no custom model is available
             return self._analyze_with_openai(user_text)
     
+    def backfill_profile(self, session_id, db):
+        """Rebuild a session's running profile from its whole chat history
+        
+        Buffered writes are flushed first so that no profile update is left
+        to be applied on top of the rebuilt totals. Returns the profile, or
+        None if the session has no messages or the flush timed out.
+        """
+        if not db.flush(timeout=float(config.get("profile_backfill_flush_timeout", 30))):
+            print(f"Not backfilling the profile of {session_id}: buffered writes did not flush in time")
+            return None
+        user_messages = db.get_all_user_messages(session_id)
+        if not user_messages:
+            return None
+        profile = self.profile_builder.history_profile(user_messages)
+        db.set_persona_profile(session_id, profile)
+        return profile
+    
+    @timed("persona.analyze_session")
+    def analyze_session(self, session_id, db):
+        """Analyze a session, from its running profile where possible
+        
+        Profiles only count messages sent since they were introduced, so a
+        profile that covers fewer messages than the stored history is
+        rebuilt from the history first. Models that cannot score term
+        counts fall back to the full message history.
+        """
+        profile = db.get_persona_profile(session_id)
+        if profile is None or profile.get("message_count", 0) < db.count_chat_history(session_id):
+            profile = self.backfill_profile(session_id, db)
+        
+        persona = self.analyze_profile(profile)
+        if persona is not None:
+            return persona
+        
+        user_messages = db.get_all_user_messages(session_id)
+        if not user_messages:
+            return "Please chat with the bot first so we can analyze your persona."
+        return self.analyze_user_persona(user_messages)
+    
+    def _model_input(self, text):
+        """Preprocess text for the model, unless its pipeline does that itself"""
+        return text if self.model.expects_raw_text else self.preprocessor.preprocess(text)
+    
+    def _format_result(self, classes, proba, predicted):
+        """Format a probability row as the persona analysis markdown"""
+        result = f"### User Persona: {classes[predicted]}\n\n"
+        result += "#### Persona Confidence Scores:\n"
+        
+        # Sort probabilities by confidence
+        sorted_probs = sorted(zip(classes, proba), key=lambda x: x[1], reverse=True)
+        for persona, prob in sorted_probs:
+            result += f"- {persona}: {prob:.2%}\n"
+        
+        return result
+    
+    def _format_style(self, features):
+        """Format session-level stylometric features as markdown"""
+        if not features:
+            return ""
+        
+        result = "\n#### Communication Style:\n"
+        result += f"- Average word length: {features['avg_word_length']:.1f}\n"
+        result += f"- Sentiment polarity: {features['sentiment_polarity']:+.2f}\n"
+        result += f"- Subjectivity: {features['sentiment_subjectivity']:.2f}\n"
+        result += f"- Questions per 100 characters: {features['question_ratio'] * 100:.2f}\n"
+        return result
+    
+    @timed("persona.score_sessions")
+    def score_sessions(self, messages_by_session, n_jobs=-1):
+        """Score a chunk of sessions with the custom model in one vectorized pass"""
+        if not self.use_custom_model:
+            raise ValueError("Batch scoring requires a trained custom model")
+        
+        sessions = [
+            (session_id, messages) for session_id, messages in messages_by_session.items()
+            if len(messages) >= MIN_MESSAGES
+        ]
+        if not sessions:
+            return []
+        
+        texts = ["\n".join(messages) for _, messages in sessions]
+        if self.model.expects_raw_text:
+            processed_texts = texts
+        else:
+            processed_texts = self.preprocessor.preprocess_many(texts, n_jobs=n_jobs)
+        proba, predicted, classes = self.model.predict_batch(processed_texts)
+        
+        scored_at = datetime.now()
+        return [
+            {
+                "session_id": session_id,
+                "timestamp": scored_at,
+                "message_count": len(messages),
+                "persona": classes[predicted[i]],
+                "probabilities": {cat: float(prob) for cat, prob in zip(classes, proba[i])},
+            }
+            for i, (session_id, messages) in enumerate(sessions)
+        ]
+    
+    def analyze_many(self, session_ids, db, chunk_size=1000, n_jobs=-1):
+        """Score many sessions chunk by chunk and bulk-write the results
+        
+        Returns the number of sessions that were scored. Sessions with fewer
+        than MIN_MESSAGES user messages are skipped.
+        """
+        self.model.set_n_jobs(n_jobs)
+        session_ids = list(session_ids)
+        scored = 0
+        for start in range(0, len(session_ids), chunk_size):
+            chunk = session_ids[start:start + chunk_size]
+            results = self.score_sessions(db.get_user_messages_for_sessions(chunk), n_jobs=n_jobs)
+            db.save_persona_results(results)
+            scored += len(results)
+            print(f"Scored {scored} sessions ({start + len(chunk)}/{len(session_ids)} read)")
+        return scored
+    
+    @timed("persona.analyze_with_openai")
     def _analyze_with_openai(self, user_text):
         """Analyze user persona using OpenAI's API"""
         system_prompt = """
@@ -60,14 +212,14 @@ class PersonaService:
         Keep the analysis professional and evidence-based. Don't make assumptions not supported by the data.
         """
         
-        response = openai.chat.completions.create(
+        # Concurrent analyses of the same conversation share one request
+        return get_llm().complete(
             model="gpt-4",  # Using a more powerful model for analysis
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Here are the user messages to analyze:\n{user_text}"}
             ],
             max_tokens=800,
-            temperature=0.7
+            temperature=0.7,
+            coalesce=True
         )
-        
-        return response.choices[0].message.content
@@ -0,0 +1,30 @@
+from services.chat_service import ChatService
+from services.fake_llm import FakeOpenAIClient
+
+def test_stream_yields_reply_and_records_latency():
+    client = FakeOpenAIClient(latency=0.02, token_latency=0.01)
+    chat_service = ChatService(client=client)
+    
+    chunks = list(chat_service.stream_bot_response("tell me about streaming", []))
+    
+    assert "".join(chunks) == "You said: tell me about streaming"
+    assert len(chunks) == 6
+    assert client.chat.completions.requests[-1]["stream"] is True
+    
+    stats = chat_service.stream_stats()
+    assert stats["responses"] == 1
+    # The first chunk waits for the response latency, the rest for each token
+    assert 0.02 <= stats["time_to_first_token_p50"] < stats["total_seconds_p50"]
+    assert stats["total_seconds_p50"] >= 0.02 + 5 * 0.01
+    assert stats["time_to_first_token_p99"] >= stats["time_to_first_token_p50"]
+
+def test_stream_stats_summarize_recent_streams():
+    chat_service = ChatService(client=FakeOpenAIClient(token_latency=0.005))
+    assert chat_service.stream_stats() == {}
+    
+    for i in range(3):
+        assert "".join(chat_service.stream_bot_response(f"message {i}", [])) == f"You said: message {i}"
+    
+    stats = chat_service.stream_stats()
+    assert stats["responses"] == 3
+    assert stats["total_seconds_p50"] <= stats["total_seconds_p99"]
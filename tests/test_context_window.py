@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from services.context_window import MESSAGE_OVERHEAD, ContextWindow, count_tokens
+
+START = datetime(2024, 1, 1)
+
+def make_history(n, words=20):
+    """n stored exchanges with distinct, equally long messages"""
+    return [
+        {
+            "_id": ObjectId(),
+            "timestamp": START + timedelta(seconds=i),
+            "user_message": f"question {i} " + "word " * words,
+            "bot_message": f"answer {i} " + "word " * words,
+        }
+        for i in range(n)
+    ]
+
+def prompt_tokens(messages):
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD for message in messages)
+
+def kept_turns(messages):
+    """The verbatim exchanges in a built prompt, as (user, assistant) pairs"""
+    turns = messages[1:-1]
+    if turns and turns[0]["role"] == "system":
+        turns = turns[1:]
+    return [(turns[i]["content"], turns[i + 1]["content"]) for i in range(0, len(turns), 2)]
+
+def test_short_history_is_kept_whole_without_summary():
+    history = make_history(3)
+    messages = ContextWindow(token_budget=3000).build_messages("hello", history, "s1")
+    
+    assert [message["role"] for message in messages] == ["system"] + ["user", "assistant"] * 3 + ["user"]
+    assert kept_turns(messages) == [(turn["user_message"], turn["bot_message"]) for turn in history]
+    assert messages[-1] == {"role": "user", "content": "hello"}
+
+def test_budget_is_respected():
+    window = ContextWindow(token_budget=400, summary_tokens=80)
+    for n in (1, 5, 50):
+        messages = window.build_messages("hello", make_history(n), f"session-{n}")
+        assert prompt_tokens(messages) <= window.token_budget
+
+def test_whole_turns_are_kept_newest_first():
+    history = make_history(50)
+    messages = ContextWindow(token_budget=400, summary_tokens=80).build_messages("hello", history, "s1")
+    
+    kept = kept_turns(messages)
+    assert 0 < len(kept) < len(history)
+    # Every kept turn has both halves, and they are the newest turns in order
+    assert kept == [(turn["user_message"], turn["bot_message"]) for turn in history[-len(kept):]]
+
+def test_summary_covers_dropped_turns():
+    history = make_history(50)
+    messages = ContextWindow(token_budget=400, summary_tokens=80).build_messages("hello", history, "s1")
+    
+    assert messages[1]["role"] == "system"
+    summary = messages[1]["content"]
+    assert summary.startswith("Summary of earlier user messages")
+    dropped = len(history) - len(kept_turns(messages))
+    # The newest dropped turn is in the summary, the kept ones are not
+    assert f"question {dropped - 1} " in summary
+    assert f"question {dropped} " not in summary
+
+def test_summary_is_extended_as_the_window_slides():
+    history = make_history(60)
+    incremental = ContextWindow(token_budget=400, summary_tokens=80)
+    for n in range(40, 61):
+        messages = incremental.build_messages("hello", history[:n], "s1")
+    
+    fresh = ContextWindow(token_budget=400, summary_tokens=80).build_messages("hello", history, "s1")
+    assert messages == fresh
+
+def test_tail_history_loads_earlier_turns_once():
+    history = make_history(60)
+    calls = []
+    
+    def load_earlier(first_turn, limit):
+        calls.append(first_turn["_id"])
+        index = history.index(first_turn)
+        return history[max(0, index - limit):index]
+    
+    window = ContextWindow(token_budget=400, summary_tokens=80)
+    for n in range(40, 61):
+        tail = history[n - 10:n]
+        messages = window.build_messages("hello", tail, "s1", load_earlier)
+    
+    full = ContextWindow(token_budget=400, summary_tokens=80).build_messages("hello", history, "s1")
+    assert messages[1] == full[1]
+    assert kept_turns(messages) == kept_turns(full)
+    # Loaded on the cold start only: later tails start where the summary already reaches
+    assert calls == [history[30]["_id"]]
+
+def test_summary_cache_is_bounded():
+    window = ContextWindow(token_budget=400, summary_tokens=80, max_sessions=3)
+    history = make_history(50)
+    for i in range(10):
+        window.build_messages("hello", history, f"session-{i}")
+    assert list(window._summaries) == ["session-7", "session-8", "session-9"]
+
+def full_summarizer(previous_summary, turns, max_tokens):
+    """A summary exactly max_tokens long, the most a summarizer may return"""
+    summary = ""
+    while count_tokens(summary + "x") <= max_tokens:
+        summary += "x"
+    return summary
+
+def test_budget_holds_at_every_boundary():
+    # Sweeping the budget a token at a time lands exactly on the edge of
+    # each kept turn, with the summary as large as it may get
+    history = make_history(50)
+    for budget in range(250, 450):
+        window = ContextWindow(token_budget=budget, summary_tokens=80, summarizer=full_summarizer)
+        messages = window.build_messages("hello", history, "s1")
+        assert count_tokens(messages[1]["content"].split("\n", 1)[1]) == 80
+        assert prompt_tokens(messages) <= budget
@@ -0,0 +1,29 @@
+import pytest
+from benchmarks.synthetic import generate_messages
+from ml.features import FEATURE_COLUMNS, FeatureExtractor
+
+SAMPLE = generate_messages(500) + [
+    "This is not good",
+    "very bad",
+    "not very good",
+    "really not good",
+    "It isn't good, it's never happy",
+    "Good!!!",
+    "I love it <3 :)",
+    "so :-( sad",
+    "wow (!) great",
+    "Not a good day... but really  nice!",
+    "e.g. fine. etc. ok",
+    "hmm\n\nnot bad at all",
+    "",
+]
+
+def test_batch_features_match_textblob():
+    extractor = FeatureExtractor()
+    batch = extractor.extract_features_batch(SAMPLE, chunk_size=128)
+    
+    assert list(batch.columns) == FEATURE_COLUMNS
+    for i, text in enumerate(SAMPLE):
+        expected = extractor.extract_all_features(text)
+        for column in FEATURE_COLUMNS:
+            assert batch[column][i] == pytest.approx(expected[column], abs=1e-9), (text, column)
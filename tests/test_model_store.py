@@ -0,0 +1,34 @@
+import os
+from ml.store import ModelStore
+
+def make_store(tmp_path, count, keep=None):
+    store = ModelStore(str(tmp_path / "models"), keep=keep)
+    for i in range(count):
+        store.save({"version": f"v{i:02d}", "categories": ["a", "b"], "pipeline": None})
+    return store
+
+def stored(store):
+    return [metadata["version"] for metadata in store.versions()]
+
+def test_prune_keeps_newest_versions(tmp_path):
+    store = make_store(tmp_path, 6)
+    served = str(tmp_path / "model.joblib")
+    store.publish("v05", served)
+    
+    assert store.prune(served, keep=2) == ["v00", "v01", "v02", "v03"]
+    assert stored(store) == ["v04", "v05"]
+    assert sorted(os.listdir(store.root)) == ["v04.joblib", "v04.json", "v05.joblib", "v05.json"]
+
+def test_prune_never_deletes_served_or_rollback_version(tmp_path):
+    store = make_store(tmp_path, 6)
+    served = str(tmp_path / "model.joblib")
+    store.publish("v02", served)
+    
+    store.prune(served, keep=1)
+    assert stored(store) == ["v01", "v02", "v05"]
+    assert store.rollback(served) == "v01"
+
+def test_prune_uses_store_default(tmp_path):
+    store = make_store(tmp_path, 4, keep=3)
+    assert store.prune(str(tmp_path / "missing.joblib")) == ["v00"]
+    assert make_store(tmp_path / "all", 4).prune(str(tmp_path / "missing.joblib")) == []
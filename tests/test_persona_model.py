@@ -0,0 +1,34 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from ml.model import PersonaModel
+
+def make_model():
+    # Labels deliberately out of sorted order; the classifier sorts them
+    pipeline = Pipeline([("tfidf", TfidfVectorizer()), ("classifier", LogisticRegression())])
+    pipeline.fit(["apple pie", "car road", "sky blue", "apple tart", "car wheel", "sky cloud"],
+                 ["zeta", "alpha", "mid", "zeta", "alpha", "mid"])
+    model = PersonaModel()
+    model.adopt_pipeline(pipeline)
+    return model, pipeline
+
+def test_predict_proba_returns_one_dict_per_row():
+    model, pipeline = make_model()
+    texts = ["apple pie", "car road", "sky blue", "apple pie"]
+    
+    results = model.predict_proba(texts)
+    
+    assert len(results) == len(texts)
+    expected = pipeline.predict_proba(texts)
+    for result, row in zip(results, expected):
+        assert list(result) == ["alpha", "mid", "zeta"]
+        assert list(result.values()) == row.tolist()
+
+def test_predict_proba_of_one_string_returns_one_dict():
+    model, pipeline = make_model()
+    
+    result = model.predict_proba("car road")
+    
+    assert isinstance(result, dict)
+    assert result == dict(zip(pipeline.classes_, pipeline.predict_proba(["car road"])[0]))
+    assert max(result, key=result.get) == "alpha"
@@ -0,0 +1,12 @@
+import os
+from utils.metrics import Profiler
+
+def test_only_the_newest_dumps_are_kept(tmp_path):
+    profiler = Profiler(directory=str(tmp_path), max_files=3)
+    for i in range(5):
+        with profiler.profile(f"turn{i}"):
+            sum(range(1000))
+        os.utime(profiler.last_path, (i, i))
+    
+    names = sorted(name.split("-")[0] for name in os.listdir(tmp_path))
+    assert names == ["turn2", "turn3", "turn4"]
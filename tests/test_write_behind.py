@@ -0,0 +1,40 @@
+from bson.errors import InvalidDocument
+from database.write_behind import WriteBehindWriter
+
+class FakeCollection:
+    """Records inserted documents and rejects any marked bad, as encoding would"""
+    
+    def __init__(self):
+        self.documents = []
+    
+    def insert_many(self, documents, ordered=True):
+        if any(document.get("bad") for document in documents):
+            raise InvalidDocument("cannot encode object")
+        self.documents.extend(documents)
+    
+    def bulk_write(self, operations, ordered=True):
+        raise RuntimeError("unexpected failure")
+
+def test_unencodable_document_is_dropped_alone():
+    chat = FakeCollection()
+    writer = WriteBehindWriter(chat, FakeCollection(), flush_interval=0.01)
+    writer.save({"session_id": "s", "n": 1})
+    writer.save({"session_id": "s", "n": 2, "bad": True})
+    writer.save({"session_id": "s", "n": 3})
+    
+    assert writer.flush(timeout=2)
+    assert [document["n"] for document in chat.documents] == [1, 3]
+    writer.close()
+
+def test_unexpected_error_does_not_stop_the_writer():
+    chat = FakeCollection()
+    writer = WriteBehindWriter(chat, FakeCollection(), flush_interval=0.01)
+    writer.save({"session_id": "s", "n": 1}, {"$inc": {"message_count": 1}})
+    assert writer.flush(timeout=2)
+    assert writer.pending("s") == []
+    
+    writer.save({"session_id": "s", "n": 2})
+    assert writer.flush(timeout=2)
+    assert writer._thread.is_alive()
+    assert [document["n"] for document in chat.documents] == [1, 2]
+    writer.close()
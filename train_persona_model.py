@@ -1,33 +1,20 @@
-import pandas as pd
 import argparse
-from ml.train import train_model_from_data
+from ml.dataset import import_labels, export_snapshot, read_snapshot
+from ml.model import VECTORIZERS, CLASSIFIERS, PersonaModel
+from ml.search import SEARCH_STRATEGIES, search_model_from_data
+from ml.train import train_model_from_data, train_model_streaming, resume_offset
 from database.mongodb import MongoDB
-import streamlit as st
-import os
-import json
-from dotenv import load_dotenv
+from utils.config import load_env_file
 
 def load_config():
-    """Load configuration from .env file or environment variables"""
-    load_dotenv()
-    
-    # Create a dictionary to simulate streamlit secrets
-    secrets = {
-        "mongo_uri": os.getenv("MONGO_URI"),
-        "mongo_db_name": os.getenv("MONGO_DB_NAME"),
-        "mongo_collection": os.getenv("MONGO_COLLECTION"),
-        "persona_collection": os.getenv("PERSONA_COLLECTION"),
-    }
-    
-    # Create a class to simulate streamlit secrets
-    class Secrets:
-        def __getitem__(self, key):
-            return secrets[key]
+    """Load configuration from .env file or environment variables
     
-    # Set st.secrets to the simulated secrets
-    st.secrets = Secrets()
+    Settings are read from the environment by upper-cased name (mongo_uri
+    from MONGO_URI, and so on); see utils.config.
+    """
+    load_env_file()
 
-def train_from_mongodb():
+def train_from_mongodb(trainer=train_model_from_data, **pipeline_options):
     """Train model from labeled data in MongoDB"""
     # Load configuration
     load_config()
@@ -45,15 +32,36 @@ def train_from_mongodb():
     # Extract texts and labels
     texts = [doc["combined_text"] for doc in labeled_data]
     labels = [doc["persona_label"] for doc in labeled_data]
+    doc_ids = [str(doc["_id"]) for doc in labeled_data]
     
     print(f"Training model with {len(texts)} labeled examples")
     
     # Train model
-    train_model_from_data(texts, labels)
+    trainer(texts, labels, doc_ids=doc_ids, **pipeline_options)
     return True
 
-def train_from_csv(csv_path):
+def train_streaming_from_mongodb(batch_size, checkpoint_every, resume):
+    """Train model out of core, streaming labeled data from MongoDB in batches"""
+    load_config()
+    db = MongoDB()
+    
+    classes = db.get_persona_labels()
+    if not classes:
+        print("No labeled data found in MongoDB")
+        return False
+    
+    skip = resume_offset() if resume else 0
+    print(f"Streaming training over {len(classes)} personas in batches of {batch_size}")
+    model = train_model_streaming(
+        db.iter_labeled_personas(batch_size=batch_size, skip=skip),
+        classes, checkpoint_every=checkpoint_every, resume=resume
+    )
+    return model is not None
+
+def train_from_csv(csv_path, trainer=train_model_from_data, **pipeline_options):
     """Train model from CSV file with texts and labels"""
+    import pandas as pd
+    
     # Load CSV file
     try:
         df = pd.read_csv(csv_path)
@@ -64,26 +72,165 @@ def train_from_csv(csv_path):
         # Extract texts and labels
         texts = df["text"].tolist()
         labels = df["persona"].tolist()
+        doc_ids = df["id"].astype(str).tolist() if "id" in df.columns else None
         
         print(f"Training model with {len(texts)} labeled examples from CSV")
         
         # Train model
-        train_model_from_data(texts, labels)
+        trainer(texts, labels, doc_ids=doc_ids, **pipeline_options)
         return True
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return False
 
+def train_from_snapshot(snapshot_path, trainer=train_model_from_data, **pipeline_options):
+    """Train model from a Parquet snapshot written by --export-snapshot"""
+    try:
+        texts, labels, doc_ids = read_snapshot(snapshot_path)
+    except (OSError, ImportError) as e:
+        print(f"Error loading snapshot: {e}")
+        return False
+    
+    if not texts:
+        print("The snapshot has no labeled data")
+        return False
+    
+    print(f"Training model with {len(texts)} labeled examples from snapshot")
+    trainer(texts, labels, doc_ids=doc_ids, **pipeline_options)
+    return True
+
+def import_label_file(path, batch_size):
+    """Load a CSV, JSONL or Parquet file of labeled sessions into MongoDB"""
+    load_config()
+    try:
+        written, skipped = import_labels(MongoDB(), path, batch_size=batch_size)
+    except (OSError, ImportError, ValueError) as e:
+        print(f"Error importing labels: {e}")
+        return False
+    print(f"Imported {written} labeled sessions from {path}")
+    if skipped:
+        print(f"Skipped {skipped} sessions with no messages")
+    return True
+
+def export_training_snapshot(path, batch_size):
+    """Write the labeled personas in MongoDB to a Parquet snapshot"""
+    load_config()
+    try:
+        rows = export_snapshot(MongoDB(), path, batch_size=batch_size)
+    except (OSError, ImportError) as e:
+        print(f"Error exporting snapshot: {e}")
+        return False
+    print(f"Exported {rows} labeled examples to {path}")
+    return True
+
+def list_models():
+    """Print the stored model versions, marking the one being served"""
+    model = PersonaModel()
+    current = model.store.current_version(model.model_path)
+    versions = model.store.versions()
+    if not versions:
+        print("No stored model versions")
+    for metadata in versions:
+        marker = "*" if metadata["version"] == current else " "
+        print(
+            f"{marker} {metadata['version']}  {metadata['created_at']}  {metadata['size'] / 1e6:.1f} MB  "
+            f"{', '.join(metadata['classes'])}"
+        )
+    return True
+
+def rollback_model(version=None):
+    """Serve an earlier stored model version"""
+    try:
+        version = PersonaModel().rollback(version)
+    except ValueError as e:
+        print(e)
+        return False
+    print(f"Now serving model version {version}")
+    return True
+
+def prune_models(keep):
+    """Delete all but the keep newest stored model versions"""
+    model = PersonaModel()
+    deleted = model.store.prune(model.model_path, keep)
+    print(f"Deleted {len(deleted)} model versions" + (f": {', '.join(deleted)}" if deleted else ""))
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description="Train persona model")
     parser.add_argument("--csv", type=str, help="Path to CSV file with labeled data")
+    parser.add_argument("--snapshot", type=str, help="Path to a Parquet snapshot written by --export-snapshot")
+    parser.add_argument("--vectorizer", choices=VECTORIZERS, help="Text vectorizer (default: tfidf)")
+    parser.add_argument("--classifier", choices=CLASSIFIERS, help="Classifier (default: forest)")
+    parser.add_argument("--stylometric", action="store_true", help="Add stylometric features of the raw text")
+    parser.add_argument("--stream", action="store_true", help="Train out of core from MongoDB in batches")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per batch when streaming")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Batches between checkpoints when streaming")
+    parser.add_argument("--resume", action="store_true", help="Resume streaming training from the last checkpoint")
+    parser.add_argument("--search", choices=SEARCH_STRATEGIES, help="Search hyperparameters with k-fold CV and keep the best model")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds for --search")
+    parser.add_argument("--cache-dir", type=str, default="ml/corpus_cache", help="Preprocessed corpus cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Preprocess every document again")
+    parser.add_argument("--list-models", action="store_true", help="List stored model versions and exit")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="Serve an earlier model version (default: the one before the current) and exit")
+    parser.add_argument("--prune-models", type=int, metavar="KEEP",
+                        help="Delete all but the KEEP newest model versions, never the served one or its rollback, and exit")
+    parser.add_argument("--import-labels", type=str, metavar="FILE",
+                        help="Upsert labeled sessions from a CSV, JSONL or Parquet file into MongoDB and exit")
+    parser.add_argument("--export-snapshot", type=str, metavar="PATH",
+                        help="Write the labeled personas in MongoDB to a Parquet snapshot and exit")
     
     args = parser.parse_args()
+    if args.list_models:
+        list_models()
+        return
+    if args.rollback is not None:
+        rollback_model(args.rollback or None)
+        return
+    if args.prune_models is not None:
+        prune_models(args.prune_models)
+        return
+    if args.import_labels:
+        import_label_file(args.import_labels, args.batch_size)
+        return
+    if args.export_snapshot:
+        export_training_snapshot(args.export_snapshot, args.batch_size)
+        return
+    
+    if args.search or args.stream:
+        pipeline_flags = [flag for flag, given in [
+            ("--vectorizer", args.vectorizer), ("--classifier", args.classifier), ("--stylometric", args.stylometric),
+        ] if given]
+        if pipeline_flags:
+            reason = "--search picks the pipeline itself" if args.search else "--stream always trains hashing + SGD"
+            parser.error(f"{', '.join(pipeline_flags)} would be ignored: {reason}")
+    
+    cache_dir = None if args.no_cache else args.cache_dir
+    pipeline_options = {
+        "vectorizer": args.vectorizer or "tfidf",
+        "classifier": args.classifier or "forest",
+        "stylometric": args.stylometric,
+        "cache_dir": cache_dir,
+    }
     
-    if args.csv:
-        success = train_from_csv(args.csv)
+    if args.search:
+        search_options = {
+            "trainer": search_model_from_data, "strategy": args.search, "folds": args.folds, "cache_dir": cache_dir,
+        }
+        if args.snapshot:
+            success = train_from_snapshot(args.snapshot, **search_options)
+        elif args.csv:
+            success = train_from_csv(args.csv, **search_options)
+        else:
+            success = train_from_mongodb(**search_options)
+    elif args.stream:
+        success = train_streaming_from_mongodb(args.batch_size, args.checkpoint_every, args.resume)
+    elif args.snapshot:
+        success = train_from_snapshot(args.snapshot, **pipeline_options)
+    elif args.csv:
+        success = train_from_csv(args.csv, **pipeline_options)
     else:
-        success = train_from_mongodb()
+        success = train_from_mongodb(**pipeline_options)
     
     if success:
         print("Model training completed successfully")
@@ -0,0 +1,65 @@
+import os
+import sys
+
+class Config:
+    """Application settings, independent of where they are stored
+    
+    A key such as "mongo_uri" is looked up, in order, in values set with
+    configure(), in the MONGO_URI environment variable and, when running
+    under Streamlit, in st.secrets. Streamlit is never imported just to read
+    configuration, so scripts and workers can use the same settings from the
+    environment (or a .env file loaded with python-dotenv).
+    """
+    
+    def __init__(self):
+        self._values = {}
+    
+    def configure(self, values):
+        """Set values that take precedence over every other source"""
+        self._values.update(values)
+    
+    def get(self, key, default=None):
+        if key in self._values:
+            return self._values[key]
+        
+        value = os.getenv(key.upper())
+        if value is not None:
+            return value
+        
+        secrets = _streamlit_secrets()
+        if secrets is not None:
+            try:
+                if key in secrets:
+                    return secrets[key]
+            except (FileNotFoundError, KeyError):
+                pass
+        return default
+    
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(f"Missing configuration value '{key}' (set it in secrets or as {key.upper()})")
+        return value
+    
+    def flag(self, key, default=False):
+        """Read a boolean setting written as true/false, 1/0 or yes/no"""
+        return str(self.get(key, default)).lower() not in ("false", "0", "no", "off")
+
+def _streamlit_secrets():
+    """st.secrets if the process is running Streamlit, otherwise None"""
+    streamlit = sys.modules.get("streamlit")
+    return getattr(streamlit, "secrets", None) if streamlit else None
+
+config = Config()
+
+def configure(values):
+    """Set configuration values for this process, e.g. in scripts and benchmarks"""
+    config.configure(values)
+
+def load_env_file(path=None):
+    """Load settings from a .env file into the environment, if python-dotenv is installed"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return False
+    return load_dotenv(path)
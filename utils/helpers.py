@@ -1,5 +1,64 @@
 import uuid
 import streamlit as st
+from database.mongodb import MongoDB
+from services.chat_service import ChatService
+from services.analysis_queue import AnalysisQueue
+from services.persona_service import PersonaService
+from utils.config import config
+from utils.metrics import start_metrics_server, start_json_log
+
+@st.cache_resource
+def get_db():
+    """Get the MongoDB wrapper shared by every session in this process
+    
+    Chat exchanges are written behind the request unless the
+    mongo_write_behind secret is turned off.
+    """
+    db = MongoDB()
+    if config.flag("mongo_write_behind", True):
+        db.enable_write_behind(
+            flush_interval=float(config.get("mongo_flush_interval", 0.5)),
+            max_batch=int(config.get("mongo_flush_batch", 500))
+        )
+    return db
+
+@st.cache_resource
+def get_chat_service():
+    """Get the ChatService shared by every session in this process"""
+    return ChatService()
+
+@st.cache_resource
+def get_persona_service(_db=None):
+    """Get the PersonaService shared by every session in this process
+    
+    Keeping one instance across reruns means the model is loaded once per
+    process instead of on every user interaction.
+    """
+    return PersonaService(_db)
+
+@st.cache_resource
+def get_analysis_queue(_persona_service, _db):
+    """Get the persona analysis queue shared by every session in this process
+    
+    analysis_workers caps how many analyses run at once.
+    """
+    return AnalysisQueue(_persona_service, _db, max_workers=int(config.get("analysis_workers", 2)))
+
+@st.cache_resource
+def start_metrics_export():
+    """Start the configured metrics exports once per process
+    
+    metrics_port serves Prometheus text format at /metrics; metrics_json_log
+    appends a snapshot to a JSON-lines file every metrics_log_interval
+    seconds. Both are off unless configured.
+    """
+    port = int(config.get("metrics_port", 0))
+    if port:
+        start_metrics_server(port)
+    log_path = config.get("metrics_json_log")
+    if log_path:
+        start_json_log(log_path, float(config.get("metrics_log_interval", 60)))
+    return True
 
 def get_session_id():
     """Get or create a unique session ID for the current user"""
@@ -0,0 +1,280 @@
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.config import config
+
+# Set PERSONA_METRICS=0 to leave instrumented functions unwrapped entirely
+ENABLED = os.getenv("PERSONA_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# Histogram bucket upper bounds in seconds, from fast preprocessing calls to
+# slow OpenAI requests
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class OperationStats:
+    """Latency histogram and recent samples of one instrumented operation"""
+    
+    def __init__(self, recent=1000):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=recent)
+    
+    def observe(self, seconds, failed=False):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+class Metrics:
+    """Process-wide latency metrics of instrumented operations
+    
+    Operations are named "<component>.<method>". Recording can be paused at
+    runtime with `enabled`; with PERSONA_METRICS=0 the decorators return the
+    original functions, so instrumentation costs nothing.
+    """
+    
+    def __init__(self):
+        self.enabled = ENABLED
+        self._operations = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, name, seconds, failed=False):
+        """Record one call of an operation"""
+        with self._lock:
+            stats = self._operations.get(name)
+            if stats is None:
+                stats = self._operations[name] = OperationStats()
+            stats.observe(seconds, failed)
+    
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+    
+    def snapshot(self):
+        """Per-operation count, errors, total and mean time, and p50/p99 of recent calls (ms)"""
+        import numpy as np
+        with self._lock:
+            operations = {name: (stats.count, stats.errors, stats.total, list(stats.recent))
+                          for name, stats in self._operations.items()}
+        
+        snapshot = {}
+        for name, (count, errors, total, recent) in sorted(operations.items()):
+            snapshot[name] = {
+                "count": count,
+                "errors": errors,
+                "total_s": round(total, 4),
+                "mean_ms": round(total / count * 1000, 3),
+                "p50_ms": round(float(np.percentile(recent, 50)) * 1000, 3),
+                "p99_ms": round(float(np.percentile(recent, 99)) * 1000, 3),
+            }
+        return snapshot
+    
+    def to_prometheus(self):
+        """Render every operation as a Prometheus histogram in text exposition format"""
+        lines = [
+            "# HELP persona_operation_seconds Latency of instrumented operations",
+            "# TYPE persona_operation_seconds histogram",
+        ]
+        errors = [
+            "# HELP persona_operation_errors_total Instrumented calls that raised",
+            "# TYPE persona_operation_errors_total counter",
+        ]
+        with self._lock:
+            for name, stats in sorted(self._operations.items()):
+                label = f'operation="{name}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'persona_operation_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'persona_operation_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f"persona_operation_seconds_sum{{{label}}} {stats.total}")
+                lines.append(f"persona_operation_seconds_count{{{label}}} {stats.count}")
+                errors.append(f"persona_operation_errors_total{{{label}}} {stats.errors}")
+        return "\n".join(lines + errors) + "\n"
+    
+    def append_json_log(self, path):
+        """Append the current snapshot to a JSON-lines log"""
+        record = {"timestamp": datetime.now().isoformat(timespec="seconds"), "operations": self.snapshot()}
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+metrics = Metrics()
+
+def timed(name):
+    """Decorator recording the latency of every call under an operation name
+    
+    Generator functions are timed from the first to the last item, so a
+    streamed response counts in full; coroutine functions until they return.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return (yield from function(*args, **kwargs))
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = yield from function(*args, **kwargs)
+                    failed = False
+                    return result
+                except GeneratorExit:
+                    # The consumer stopped early; that is not a failure
+                    failed = False
+                    raise
+                finally:
+                    metrics.observe(name, time.perf_counter() - start, failed)
+            return generator_wrapper
+        
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def coroutine_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return await function(*args, **kwargs)
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = await function(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    metrics.observe(name, time.perf_counter() - start, failed)
+            return coroutine_wrapper
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                metrics.observe(name, time.perf_counter() - start, failed)
+        return wrapper
+    return decorator
+
+def instrument(component):
+    """Class decorator timing every public method as "<component>.<method>" """
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if not attribute.startswith("_") and inspect.isfunction(value):
+                setattr(cls, attribute, timed(f"{component}.{attribute}")(value))
+        return cls
+    return decorator
+
+class Profiler:
+    """Opt-in cProfile capture of individual requests
+    
+    Profiles are written as .prof files (open them with snakeviz or pstats)
+    and the text summary of the latest one is kept for display. Only the
+    newest max_files dumps are kept in the directory.
+    """
+    
+    def __init__(self, directory="profiles", top=25, max_files=50):
+        self.directory = directory
+        self.top = top
+        self.max_files = max_files
+        self.last_summary = None
+        self.last_path = None
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def profile(self, label, enabled=True):
+        """Profile the enclosed block when enabled; otherwise do nothing
+        
+        cProfile can only trace one block per thread at a time, so
+        overlapping requests are not profiled twice.
+        """
+        if not enabled or not self._lock.acquire(blocking=False):
+            yield
+            return
+        
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+            self._save(profiler, label)
+        finally:
+            self._lock.release()
+    
+    def _save(self, profiler, label):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+        profiler.dump_stats(path)
+        self._prune()
+        
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        self.last_summary = summary.getvalue()
+        self.last_path = path
+    
+    def _prune(self):
+        """Delete the oldest dumps beyond max_files"""
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".prof")]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(len(paths) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing old profile {path}: {e}")
+
+profiler = Profiler(max_files=int(config.get("profile_max_files", 50)))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics in Prometheus text format from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def start_json_log(path, interval=60.0):
+    """Append a metrics snapshot to a JSON-lines file every interval seconds"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.append_json_log(path)
+            except OSError as e:
+                print(f"Error writing metrics log: {e}")
+    
+    thread = threading.Thread(target=run, name="metrics-json-log", daemon=True)
+    thread.start()
+    return thread